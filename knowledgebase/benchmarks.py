@@ -0,0 +1,529 @@
+# benchmarks.py
+# Benchmark suite for the Crisis Assistant: startup, classification latency,
+# memory, hot-reload, typo-tolerance, critical-tier cost and warm-start time, on the real
+# knowledge base and synthetic corpora up to 10k+ procedures
+#
+# Usage:
+#   python benchmarks.py                         run with default scales
+#   python benchmarks.py --scales 6,1000,10000 -o results.json
+#   python benchmarks.py --compare old.json new.json
+
+import argparse
+import importlib.util
+import io
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from typing import Callable, Dict, List, Tuple
+
+from emergency_database import EmergencyDatabase
+from keyword_matcher import FuzzyKeywordIndex
+from kb_format import compile_knowledge_base, write_data_dir
+from procedure_record import Procedure, intern_keywords
+
+KNOWLEDGEBASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ASSISTANT_SCRIPT = os.path.join(KNOWLEDGEBASE_DIR, 'rag assisatant .py')
+
+SAMPLE_QUERIES = [
+    "Someone is bleeding heavily from their arm",
+    "Person collapsed and not breathing",
+    "Got burned by hot water on my hand",
+    "Child is choking on food",
+    "I think my leg is broken after falling",
+    "Person in shock, pale and weak",
+    "help me please",
+]
+
+# Life-threatening queries, answered from the critical tier
+CRITICAL_QUERIES = [
+    "Someone is bleeding heavily from their arm",
+    "Person collapsed and not breathing",
+    "Child is choking on food",
+    "Person in shock, pale and weak",
+    "he stopped breathing, starting cpr",
+    "deep stab wound bleeding a lot",
+]
+
+# Everyday wording a word or two away from first-aid keywords; typo matching
+# must leave every one of these to general help
+EVERYDAY_QUERIES = [
+    "I found him on the floor",
+    "what would you do",
+    "he could not breathe",
+    "I heard a noise",
+    "I turned off the stove",
+    "bread",
+]
+
+
+def load_assistant_module():
+    """Import the assistant script, whose file name is not a valid module name"""
+    module = sys.modules.get('crisis_assistant')
+    if module is None:
+        spec = importlib.util.spec_from_file_location('crisis_assistant', ASSISTANT_SCRIPT)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules['crisis_assistant'] = module
+        spec.loader.exec_module(module)
+    return module
+
+
+def generate_corpus(n_procedures: int, keywords_per_type: int = 10, seed: int = 0,
+                    critical_synthetic: bool = True) -> Tuple[Dict[str, Dict], Dict[str, List[str]]]:
+    """Synthetic procedures and keyword lists shaped like the real ones
+
+    The six real procedures are always included. Synthetic entries reuse
+    real procedure text and keywords mixed with generated words, so
+    keywords repeat across types the way they do in the real table. With
+    critical_synthetic False no synthetic procedure is CRITICAL or
+    time-critical: a growing long tail around the real critical tier.
+    """
+    rng = random.Random(seed)
+    real = EmergencyDatabase()
+    procedures = dict(real.procedures)
+    keywords = {t: list(kws) for t, kws in real.keywords.items()}
+
+    real_keywords = sorted({kw for kws in real.keywords.values() for kw in kws})
+    real_text = [line for p in real.procedures.values()
+                 for field in ('procedure', 'critical_warnings', 'supplies_needed', 'when_to_seek_help')
+                 for line in p[field]]
+    syllables = ['ba', 'ce', 'di', 'fo', 'gu', 'ha', 'ki', 'lo', 'mu', 'ne', 'pi', 'ra',
+                 'so', 'tu', 'vy', 'we', 'xo', 'za']
+    vocabulary = [''.join(rng.choice(syllables) for _ in range(rng.randint(2, 4)))
+                  for _ in range(max(200, n_procedures // 2))]
+    urgencies = ['CRITICAL', 'HIGH', 'MODERATE'] if critical_synthetic else ['HIGH', 'MODERATE']
+
+    def sentence(count: int) -> str:
+        return ' '.join(rng.choice(vocabulary) for _ in range(count))
+
+    for i in range(len(procedures), n_procedures):
+        emergency_type = f"synthetic_{i}"
+        procedures[emergency_type] = {
+            'title': f"{sentence(2).title()} Management",
+            'category': 'synthetic',
+            'source': 'Synthetic benchmark corpus',
+            'procedure': [f"{step}. {sentence(2).upper()} - {rng.choice(real_text)} {sentence(3)}"
+                          for step in range(1, 11)],
+            'critical_warnings': [f"⚠️  {sentence(6)}" for _ in range(4)],
+            'supplies_needed': [sentence(3) for _ in range(4)],
+            'when_to_seek_help': [rng.choice(real_text) for _ in range(3)],
+            'urgency': rng.choice(urgencies),
+            'time_critical': critical_synthetic and rng.random() < 0.3,
+        }
+        type_keywords = [rng.choice(vocabulary) for _ in range(keywords_per_type - 2)]
+        type_keywords += rng.sample(real_keywords, 2)
+        keywords[emergency_type] = type_keywords
+
+    return procedures, keywords
+
+
+def corpus_database(procedures: Dict[str, Dict], keywords: Dict[str, List[str]]) -> EmergencyDatabase:
+    """EmergencyDatabase loaded with the given procedures and keywords"""
+
+    class SyntheticDatabase(EmergencyDatabase):
+        def _load_procedures(self) -> Dict:
+            return procedures
+
+        def _load_keywords(self) -> Dict[str, List[str]]:
+            return keywords
+
+    return SyntheticDatabase()
+
+
+def latency_summary(samples: List[float]) -> Dict[str, float]:
+    """p50/p95/p99/max/mean of latency samples, in milliseconds"""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pick(fraction: float) -> float:
+        return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)] * 1000
+
+    return {
+        'p50_ms': pick(0.50),
+        'p95_ms': pick(0.95),
+        'p99_ms': pick(0.99),
+        'max_ms': ordered[-1] * 1000,
+        'mean_ms': sum(ordered) / len(ordered) * 1000,
+        'samples': len(ordered),
+    }
+
+
+def time_calls(function: Callable, arguments: List, repeat: int = 1) -> List[float]:
+    """Time each call of function over the arguments"""
+    samples = []
+    clock = time.perf_counter
+    for _ in range(repeat):
+        for argument in arguments:
+            start = clock()
+            function(argument)
+            samples.append(clock() - start)
+    return samples
+
+
+def peak_rss_kb() -> int:
+    """Peak resident set size of this process so far, in kB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def measure_imports(runs: int = 5) -> Dict[str, Dict[str, float]]:
+    """Cold import times, each measured in a fresh interpreter"""
+    snippets = {
+        'emergency_database': "import emergency_database",
+        'emergency_database+EmergencyDatabase()': "import emergency_database; emergency_database.EmergencyDatabase()",
+        'assistant_script': ("import importlib.util; "
+                             f"s = importlib.util.spec_from_file_location('crisis_assistant', {ASSISTANT_SCRIPT!r}); "
+                             "s.loader.exec_module(importlib.util.module_from_spec(s))"),
+    }
+    results = {}
+    for name, snippet in snippets.items():
+        code = ("import time; _t = time.perf_counter(); " + snippet +
+                "; print(time.perf_counter() - _t)")
+        samples = []
+        for _ in range(runs):
+            child = subprocess.run([sys.executable, '-c', code], capture_output=True,
+                                   text=True, cwd=KNOWLEDGEBASE_DIR)
+            samples.append(float(child.stdout.strip().splitlines()[-1]))
+        results[name] = latency_summary(samples)
+    return results
+
+
+def deep_size(obj, seen: set = None) -> int:
+    """Bytes held by obj and everything it references, shared objects counted once"""
+    seen = set() if seen is None else seen
+    total = 0
+    stack = [obj]
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        total += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple)):
+            stack.extend(item)
+        elif isinstance(item, Procedure):
+            stack.extend(getattr(item, field) for field in Procedure.__slots__)
+    return total
+
+
+def measure_storage(procedures: Dict[str, Dict], keywords: Dict[str, List[str]]) -> Dict[str, float]:
+    """Bytes per procedure as decoded dicts of lists versus compact records
+
+    Both start from a JSON round trip, so no strings are shared beforehand,
+    as when procedures are read from files.
+    """
+    raw_procedures, raw_keywords = json.loads(json.dumps(
+        [{t: dict(p) for t, p in procedures.items()}, keywords]))
+    records = {t: Procedure.from_dict(p) for t, p in raw_procedures.items()}
+    interned = intern_keywords(raw_keywords)
+    n_procedures = len(procedures)
+    return {
+        'dict_procedure_bytes': deep_size(raw_procedures) / n_procedures,
+        'record_procedure_bytes': deep_size(records) / n_procedures,
+        'dict_keyword_bytes': deep_size(raw_keywords) / n_procedures,
+        'record_keyword_bytes': deep_size(interned) / n_procedures,
+    }
+
+
+def measure_reload(procedures: Dict[str, Dict], keywords: Dict[str, List[str]],
+                   edits: int = 20) -> Dict[str, float]:
+    """Full data-directory load versus applying a one-procedure edit"""
+    directory = tempfile.mkdtemp(prefix='crisis-kb-')
+    try:
+        write_data_dir(procedures, keywords, directory)
+        start = time.perf_counter()
+        db = EmergencyDatabase(data_dir=directory)
+        full_load = time.perf_counter() - start
+
+        name = sorted(os.listdir(directory))[len(procedures) // 2]
+        path = os.path.join(directory, name)
+        with open(path) as f:
+            record = json.load(f)
+        apply_samples, scan_samples = [], []
+        for edit in range(edits):
+            # A corrected step plus one brand-new keyword
+            record['procedure'] = record['procedure'][:-1] + [f"Revised step {edit}"]
+            record['keywords'] = record['keywords'][:-1] + [f"revisedkeyword{edit}"]
+            with open(path, 'w') as f:
+                json.dump(record, f)
+            db.check_for_changes()
+            apply_samples.append(db.last_update['seconds'])
+            scan_samples.append(db.last_update['scan_seconds'])
+        return {
+            'full_load_seconds': full_load,
+            'edit_apply': latency_summary(apply_samples),
+            'edit_scan': latency_summary(scan_samples),
+        }
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def measure_warm_start(procedures: Dict[str, Dict], keywords: Dict[str, List[str]],
+                       runs: int = 3) -> Dict[str, float]:
+    """Boot-to-ready time of a compiled knowledge base: cold index build
+    versus loading the index cache
+
+    Ready means the keyword matcher (with its typo index), keyword index
+    and critical-tier matcher are in memory. Medians over runs.
+    """
+    directory = tempfile.mkdtemp(prefix='crisis-cache-')
+    try:
+        kb_path = os.path.join(directory, 'kb.ekb')
+        cache_dir = os.path.join(directory, 'cache')
+        compile_knowledge_base(procedures, keywords, kb_path)
+
+        def boot(**options) -> float:
+            start = time.perf_counter()
+            db = EmergencyDatabase(kb_path, **options)
+            db.get_critical_matcher().fuzzy_index()
+            db.keyword_matcher.fuzzy_index()
+            return time.perf_counter() - start
+
+        def median(samples: List[float]) -> float:
+            return sorted(samples)[len(samples) // 2]
+
+        cold = median([boot(index_cache_dir=cache_dir, rebuild_index_cache=True)
+                       for _ in range(runs)])
+        warm = median([boot(index_cache_dir=cache_dir) for _ in range(runs)])
+        return {
+            'cold_seconds': cold,
+            'warm_seconds': warm,
+            'cache_bytes': sum(entry.stat().st_size for entry in os.scandir(cache_dir)),
+        }
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def misspell(word: str, rng: random.Random) -> str:
+    """The word with one character dropped, doubled or swapped with its neighbour"""
+    i = rng.randrange(1, len(word) - 1)
+    edit = rng.randrange(3)
+    if edit == 0:
+        return word[:i] + word[i + 1:]
+    if edit == 1:
+        return word[:i] + word[i] + word[i:]
+    return word[:i - 1] + word[i] + word[i - 1] + word[i + 1:]
+
+
+def measure_fuzzy(assistant, queries: List[str], seed: int = 0) -> Dict:
+    """Keyword scoring with and without typo-tolerant matching
+
+    Typo queries misspell one keyword of five or more letters, each query
+    differently, so most lookups miss the per-word cache. A typo query is
+    resolved when the assistant answers it with a procedure.
+    """
+    rng = random.Random(seed)
+    min_confidence = load_assistant_module().MIN_CONFIDENCE
+    matcher = assistant.db.keyword_matcher
+    words = [p for p in matcher.patterns if len(p) >= 5 and p.isalpha()]
+    typo_queries = [f"help {misspell(rng.choice(words), rng)} now" for _ in queries]
+
+    matcher.fuzzy = False
+    exact = latency_summary(time_calls(matcher.score, queries))
+    exact_typos = latency_summary(time_calls(matcher.score, typo_queries))
+    matcher.fuzzy = True
+    start = time.perf_counter()
+    index = FuzzyKeywordIndex()
+    for pattern_id, pattern in enumerate(matcher.patterns):
+        index.add(pattern, pattern_id)
+    build_seconds = time.perf_counter() - start
+    return {
+        'index_build_seconds': build_seconds,
+        'exact': exact,
+        'exact_on_typos': exact_typos,
+        'fuzzy': latency_summary(time_calls(matcher.score, queries)),
+        'fuzzy_on_typos': latency_summary(time_calls(matcher.score, typo_queries)),
+        'typos_resolved': sum(assistant.analyze_query(q)[1] >= min_confidence
+                              for q in typo_queries) / len(typo_queries),
+        'everyday_matched': sum(bool(matcher.score(q)) for q in EVERYDAY_QUERIES),
+    }
+
+
+def measure_critical_path(n_procedures: int, n_queries: int, seed: int = 0) -> Dict:
+    """Life-threatening query latency with and without the critical-tier fast path
+
+    The corpus grows only outside the critical tier, as a real knowledge
+    base would; the fast path should stay flat while the full scan grows.
+    """
+    assistant_module = load_assistant_module()
+    procedures, keywords = generate_corpus(n_procedures, seed=seed, critical_synthetic=False)
+    db = corpus_database(procedures, keywords)
+    assistant = assistant_module.OfflineCrisisAssistant(cache_size=0)
+    assistant.db = db
+    queries = [CRITICAL_QUERIES[i % len(CRITICAL_QUERIES)] for i in range(n_queries)]
+
+    results = {'critical_types': len(db.get_critical_types())}
+    for label, fast_path in (('fast_path', True), ('full_scan', False)):
+        assistant.critical_fast_path = fast_path
+        # One warm-up query, so one-off lazy index builds are not counted
+        assistant.analyze_query(queries[0])
+        results[label] = latency_summary(time_calls(assistant.analyze_query, queries))
+    return results
+
+
+def benchmark_scale(n_procedures: int, n_queries: int, seed: int = 0) -> Dict:
+    """Build a corpus of n_procedures and measure construction and query latency"""
+    assistant_module = load_assistant_module()
+    procedures, keywords = generate_corpus(n_procedures, seed=seed)
+
+    start = time.perf_counter()
+    db = corpus_database(procedures, keywords)
+    build_seconds = time.perf_counter() - start
+
+    assistant = assistant_module.OfflineCrisisAssistant(cache_size=0)
+    assistant.db = db
+
+    # Real queries plus queries made of synthetic keywords
+    rng = random.Random(seed)
+    keyword_pool = [kw for kws in keywords.values() for kw in kws]
+    queries = [rng.choice(SAMPLE_QUERIES) if i % 2 else
+               f"help {rng.choice(keyword_pool)} and {rng.choice(keyword_pool)}"
+               for i in range(n_queries)]
+    search_terms = [rng.choice(keyword_pool)[:rng.randint(2, 6)] for _ in range(n_queries)]
+
+    def end_to_end(query: str):
+        with redirect_stdout(io.StringIO()):
+            assistant.process_emergency_query(query)
+
+    end_to_end_samples = time_calls(end_to_end, queries[:max(1, n_queries // 4)])
+    histograms = assistant.metrics.histograms
+
+    return {
+        'procedures': len(procedures),
+        'keywords': len(keyword_pool),
+        'build_seconds': build_seconds,
+        'analyze_query': latency_summary(time_calls(assistant.analyze_query, queries)),
+        'search_by_keyword': latency_summary(time_calls(db.search_by_keyword, search_terms)),
+        'process_emergency_query': latency_summary(end_to_end_samples),
+        # Stage histograms recorded by the assistant during the end-to-end runs
+        'first_instruction': histograms['first_instruction'].to_dict(),
+        'render': histograms['render'].to_dict(),
+        'reload': measure_reload(procedures, keywords),
+        'warm_start': measure_warm_start(procedures, keywords),
+        'storage': measure_storage(procedures, keywords),
+        'fuzzy': measure_fuzzy(assistant, queries, seed),
+        'critical_path': measure_critical_path(n_procedures, n_queries, seed),
+        'peak_rss_kb': peak_rss_kb(),
+    }
+
+
+def run_benchmarks(scales: List[int], n_queries: int = 2000, import_runs: int = 5) -> Dict:
+    """Run the whole suite and return JSON-serializable results"""
+    results = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+        },
+        'imports': measure_imports(import_runs),
+        'scales': [],
+    }
+    # Ascending scales, so the (monotonic) peak RSS reflects the largest corpus so far
+    for n_procedures in sorted(scales):
+        results['scales'].append(benchmark_scale(n_procedures, n_queries))
+        print_scale(results['scales'][-1])
+    return results
+
+
+def print_scale(scale: Dict):
+    """One line per corpus size"""
+    print(f"• {scale['procedures']:>6} procedures: build {scale['build_seconds'] * 1000:8.1f} ms | "
+          f"analyze p50/p99 {scale['analyze_query']['p50_ms']:.3f}/{scale['analyze_query']['p99_ms']:.3f} ms | "
+          f"search p99 {scale['search_by_keyword']['p99_ms']:.3f} ms | "
+          f"end-to-end p99 {scale['process_emergency_query']['p99_ms']:.3f} ms | "
+          f"peak RSS {scale['peak_rss_kb'] / 1024:.1f} MB")
+    print(f"  {'':>6}  first instruction p50/p99 {scale['first_instruction']['p50_ms']:.3f}/"
+          f"{scale['first_instruction']['p99_ms']:.3f} ms | render p50/p99 "
+          f"{scale['render']['p50_ms']:.3f}/{scale['render']['p99_ms']:.3f} ms")
+    storage = scale['storage']
+    print(f"  {'':>6}  storage per procedure: {storage['dict_procedure_bytes']:.0f} B as dicts -> "
+          f"{storage['record_procedure_bytes']:.0f} B as records, keywords "
+          f"{storage['dict_keyword_bytes']:.0f} B -> {storage['record_keyword_bytes']:.0f} B")
+    reload = scale['reload']
+    print(f"  {'':>6}  reload: full {reload['full_load_seconds'] * 1000:8.1f} ms | "
+          f"one-procedure edit p50 {reload['edit_apply']['p50_ms']:.2f} ms "
+          f"(+ {reload['edit_scan']['p50_ms']:.2f} ms directory scan)")
+    warm_start = scale['warm_start']
+    print(f"  {'':>6}  boot to ready: cold build {warm_start['cold_seconds'] * 1000:8.1f} ms | "
+          f"index cache {warm_start['warm_seconds'] * 1000:8.1f} ms "
+          f"({warm_start['cache_bytes'] / 1e6:.1f} MB cached)")
+    fuzzy = scale['fuzzy']
+    print(f"  {'':>6}  keyword score p50/p99: exact {fuzzy['exact']['p50_ms']:.3f}/"
+          f"{fuzzy['exact']['p99_ms']:.3f} ms, with typo matching {fuzzy['fuzzy']['p50_ms']:.3f}/"
+          f"{fuzzy['fuzzy']['p99_ms']:.3f} ms | typo queries {fuzzy['fuzzy_on_typos']['p50_ms']:.3f}/"
+          f"{fuzzy['fuzzy_on_typos']['p99_ms']:.3f} ms, {fuzzy['typos_resolved']:.0%} resolved, "
+          f"{fuzzy['everyday_matched']}/{len(EVERYDAY_QUERIES)} everyday queries matched "
+          f"(index built in {fuzzy['index_build_seconds'] * 1000:.1f} ms)")
+    critical = scale['critical_path']
+    print(f"  {'':>6}  life-threatening queries p50/p99/max: critical tier first "
+          + "/".join(f"{critical['fast_path'][k]:.3f}" for k in ('p50_ms', 'p99_ms', 'max_ms'))
+          + " ms, full scan "
+          + "/".join(f"{critical['full_scan'][k]:.3f}" for k in ('p50_ms', 'p99_ms', 'max_ms'))
+          + f" ms ({critical['critical_types']} critical types)")
+
+
+def compare_results(old_path: str, new_path: str):
+    """Print per-scale p99 and build-time ratios between two result files"""
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    old_scales = {s['procedures']: s for s in old['scales']}
+
+    print(f"\n📊 BENCHMARK COMPARISON: {old_path} -> {new_path}")
+    print("="*60)
+    for scale in new['scales']:
+        before = old_scales.get(scale['procedures'])
+        if before is None:
+            continue
+        print(f"• {scale['procedures']} procedures:")
+        print(f"   build:    {before['build_seconds'] * 1000:9.2f} -> {scale['build_seconds'] * 1000:9.2f} ms")
+        for metric in ('analyze_query', 'search_by_keyword', 'process_emergency_query'):
+            a, b = before[metric]['p99_ms'], scale[metric]['p99_ms']
+            ratio = f"x{b / a:.2f}" if a else "n/a"
+            print(f"   {metric} p99: {a:.3f} -> {b:.3f} ms ({ratio})")
+    print("="*60)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Crisis Assistant benchmark suite")
+    parser.add_argument('--scales', default='6,100,1000,10000',
+                        help="comma-separated corpus sizes (default: 6,100,1000,10000)")
+    parser.add_argument('--queries', type=int, default=2000,
+                        help="queries timed per scale (default: 2000)")
+    parser.add_argument('--import-runs', type=int, default=5,
+                        help="fresh interpreters per import measurement (default: 5)")
+    parser.add_argument('--output', '-o', default='benchmark_results.json',
+                        help="where to save JSON results")
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'),
+                        help="compare two saved result files and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare_results(*args.compare)
+        return
+
+    print("⏱️  CRISIS ASSISTANT BENCHMARKS")
+    print("="*60)
+    results = run_benchmarks([int(n) for n in args.scales.split(',')], args.queries, args.import_runs)
+    for name, summary in results['imports'].items():
+        print(f"• import {name}: p50 {summary['p50_ms']:.1f} ms")
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"✅ Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# conversation_context.py
+# Conversation context for the Crisis Assistant: a fixed ring of recent turns
+# and a decayed score per emergency type, so a follow-up such as "he's now
+# pale and cold" is read in the light of the earlier "bleeding heavily"
+
+from collections import deque
+from typing import Dict, Iterable
+
+# Turns remembered; a turn that drops out of the ring no longer counts
+CONTEXT_TURNS = 6
+# Weight of a turn relative to the one after it
+CONTEXT_DECAY = 0.95
+
+
+class ConversationContext:
+    """
+    Recent turns of one conversation and a decayed score per emergency type
+    A type's score is the sum of its confidence in each remembered turn,
+    scaled by decay once per later turn. Each turn adds only its own ranking
+    and subtracts that of the turn leaving the ring, so a turn costs the
+    same however long the conversation runs.
+    """
+
+    def __init__(self, max_turns: int = CONTEXT_TURNS, decay: float = CONTEXT_DECAY):
+        self.max_turns = max_turns
+        self.decay = decay
+        # (query, ranked) per turn, oldest first
+        self.turns: deque = deque(maxlen=max_turns)
+        self.scores: Dict[str, float] = {}
+        # Remembered turns that credit each type; a type is dropped from
+        # scores with its last contribution rather than when it rounds to 0
+        self._counts: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.turns)
+
+    def add_turn(self, query: str, ranked: Iterable[tuple]) -> tuple:
+        """Fold one turn's (emergency_type, confidence) ranking into the context
+
+        Returns the conversation's (emergency_type, confidence) ranking. Types
+        matched by this turn come first, ordered by score, so a new emergency
+        is never outranked by an earlier one; types known only from earlier
+        turns follow.
+        """
+        ranked = tuple(ranked)
+        scores, counts = self.scores, self._counts
+        if len(self.turns) == self.max_turns:
+            # The oldest turn has been decayed once per turn since
+            weight = self.decay ** (self.max_turns - 1)
+            for emergency_type, confidence in self.turns[0][1]:
+                counts[emergency_type] -= 1
+                if counts[emergency_type]:
+                    scores[emergency_type] -= confidence * weight
+                else:
+                    del counts[emergency_type], scores[emergency_type]
+        for emergency_type in scores:
+            scores[emergency_type] *= self.decay
+        for emergency_type, confidence in ranked:
+            scores[emergency_type] = scores.get(emergency_type, 0.0) + confidence
+            counts[emergency_type] = counts.get(emergency_type, 0) + 1
+        self.turns.append((query, ranked))
+
+        # Ties keep this turn's order, then the order types entered the context
+        current = {emergency_type: i for i, (emergency_type, _) in enumerate(ranked)}
+        order = sorted(scores, key=lambda t: (t not in current, -scores[t], current.get(t, 0)))
+        return tuple((emergency_type, min(scores[emergency_type], 1.0)) for emergency_type in order)
+
+    def clear(self):
+        """Start a new conversation"""
+        self.turns.clear()
+        self.scores.clear()
+        self._counts.clear()
+
+    def to_dict(self) -> Dict:
+        return {
+            'turns': len(self.turns),
+            'scores': dict(sorted(self.scores.items(), key=lambda item: -item[1])),
+        }
@@ -0,0 +1,416 @@
+# crisis_server.py
+# Asyncio multi-client server and load generator for the Crisis Assistant
+#
+# Protocol: newline-delimited JSON over TCP or a Unix socket.
+#   request   {"id": 1, "query": "someone is bleeding", "render": true}
+#   response  {"id": 1, "emergency_type": "bleeding", "confidence": 0.07,
+#              "response": "...full response text..."}
+#   streaming {"id": 6, "query": "...", "stream": true} is answered with one
+#             {"id": 6, "chunk": "..."} line per response chunk, first action
+#             step first, then {"id": 6, "emergency_type": ..., "confidence": ...,
+#             "done": true}
+#   Queries on one connection are turns of one conversation: a follow-up is
+#   analyzed together with the queries before it. "context": false in a
+#   request analyzes that query alone.
+#   When the assistant generates answers, rendered responses wait for the
+#   generated text on worker threads, so other clients are served meanwhile
+#   and identical concurrent queries share one generation.
+#   commands  {"id": 2, "command": "session"} returns this connection's session
+#             {"id": 3, "command": "ping"}    returns {"id": 3, "pong": true}
+#             {"id": 5, "command": "metrics"} returns per-stage query timings
+#             {"id": 7, "command": "new"}     starts a new conversation
+#   errors    {"id": 4, "error": "..."}
+# Clients may pipeline requests; responses come back in request order.
+
+import asyncio
+import itertools
+import json
+import signal
+import time
+from typing import Dict, Iterator, List, Optional
+
+from conversation_context import ConversationContext
+
+# Queued by a connection's reader when it stops reading
+_EOF = object()
+# Yielded by a response generator whose remaining steps may block
+_BLOCKING = object()
+
+
+class ClientSession:
+    """State kept for one client connection"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, peer: str):
+        self.session_id = next(self._ids)
+        self.peer = peer
+        self.connected_at = time.time()
+        self.queries = 0
+        self.last_emergency_type = None
+        # Recent queries, so follow-ups are read in context
+        self.context = ConversationContext()
+
+    def context_for(self, request: Dict) -> Optional[ConversationContext]:
+        """Conversation context to analyze a request with, None to analyze it alone"""
+        return self.context if request.get('context', True) else None
+
+    def to_dict(self) -> Dict:
+        return {
+            'session_id': self.session_id,
+            'peer': self.peer,
+            'connected_at': self.connected_at,
+            'queries': self.queries,
+            'last_emergency_type': self.last_emergency_type,
+            'context': self.context.to_dict(),
+        }
+
+
+class CrisisServer:
+    """
+    Serves query analysis and rendered responses to many clients at once
+    Each connection has a reader that queues up to max_pipeline requests;
+    when the queue is full the reader stops reading, so a fast client is
+    held back by TCP flow control instead of growing server memory
+    """
+
+    def __init__(self, assistant, max_connections: int = 64, max_pipeline: int = 32,
+                 max_line: int = 16 * 1024, shutdown_timeout: float = 5.0):
+        self.assistant = assistant
+        self.max_connections = max_connections
+        self.max_pipeline = max_pipeline
+        self.max_line = max_line
+        self.shutdown_timeout = shutdown_timeout
+        self.sessions: Dict[int, ClientSession] = {}
+        self.requests_served = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections: set = set()
+        self._readers: set = set()
+        self._closing = False
+
+    async def start(self, host: str = '127.0.0.1', port: int = 8765, path: str = None):
+        """Start listening on a TCP port, or on a Unix socket if path is given"""
+        if path:
+            self._server = await asyncio.start_unix_server(self._handle_client, path=path,
+                                                           limit=self.max_line)
+        else:
+            self._server = await asyncio.start_server(self._handle_client, host, port,
+                                                      limit=self.max_line)
+        return self._server
+
+    @property
+    def addresses(self) -> List:
+        """Socket addresses the server is listening on"""
+        return [sock.getsockname() for sock in self._server.sockets] if self._server else []
+
+    async def shutdown(self):
+        """Stop accepting clients and let open connections finish queued requests"""
+        if self._closing:
+            return
+        self._closing = True
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        # Stop reading new requests; requests already queued are still answered
+        for reader_task in list(self._readers):
+            reader_task.cancel()
+        if self._connections:
+            await asyncio.wait(self._connections, timeout=self.shutdown_timeout)
+        for task in list(self._connections):
+            task.cancel()
+
+    async def serve_forever(self):
+        """Run until SIGINT/SIGTERM, then shut down gracefully"""
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop.set)
+            except (NotImplementedError, RuntimeError):
+                pass  # not supported on this platform; Ctrl+C still raises
+        await stop.wait()
+        await self.shutdown()
+
+    def handle_request(self, request: Dict, session: ClientSession) -> Dict:
+        """Answer one decoded request for a session"""
+        request_id = request.get('id')
+        command = request.get('command')
+        if command == 'ping':
+            return {'id': request_id, 'pong': True}
+        if command == 'session':
+            return {'id': request_id, 'session': session.to_dict()}
+        if command == 'metrics':
+            return {'id': request_id, 'metrics': self.assistant.metrics.snapshot()}
+        if command == 'new':
+            session.context.clear()
+            return {'id': request_id, 'new': True}
+        if command is not None:
+            return {'id': request_id, 'error': f"Unknown command: {command}"}
+
+        query = request.get('query')
+        if not isinstance(query, str) or not query.strip():
+            return {'id': request_id, 'error': "Request needs a non-empty 'query'"}
+
+        # This query's own stage timings; other connections' queries may be
+        # timed meanwhile
+        timings = {}
+        if request.get('render', True):
+            emergency_type, confidence, response = self.assistant.answer_query(
+                query, session.context_for(request), timings)
+        else:
+            emergency_type, confidence = self.assistant.analyze_query(
+                query, session.context_for(request))
+            response = None
+        session.queries += 1
+        session.last_emergency_type = emergency_type
+        self.assistant.log_query(query, emergency_type, confidence,
+                                 channel='server', client=session.session_id, timings=timings)
+        result = {'id': request_id, 'emergency_type': emergency_type, 'confidence': confidence}
+        if response is not None:
+            result['response'] = response
+        return result
+
+    def stream_request(self, request: Dict, session: ClientSession) -> Iterator[Dict]:
+        """Answer a query as response chunks in priority order, then a summary"""
+        request_id = request.get('id')
+        query = request.get('query')
+        if not isinstance(query, str) or not query.strip():
+            yield {'id': request_id, 'error': "Request needs a non-empty 'query'"}
+            return
+
+        timings = {}
+        emergency_type, confidence, chunks = self.assistant.stream_answer(
+            query, session.context_for(request), timings)
+        if self.assistant.generator is not None:
+            # Chunks after the header wait for generated text
+            yield _BLOCKING
+        for chunk in chunks:
+            yield {'id': request_id, 'chunk': chunk}
+        session.queries += 1
+        session.last_emergency_type = emergency_type
+        self.assistant.log_query(query, emergency_type, confidence,
+                                 channel='server', client=session.session_id, timings=timings)
+        yield {'id': request_id, 'emergency_type': emergency_type,
+               'confidence': confidence, 'done': True}
+
+    def collect_stream(self, request: Dict, session: ClientSession) -> Iterator[Dict]:
+        """A streamed answer joined into one response line, as handle_request renders it"""
+        chunks = []
+        for response in self.stream_request(request, session):
+            if response is _BLOCKING:
+                yield response
+            elif 'chunk' in response:
+                chunks.append(response['chunk'])
+            elif response.pop('done', False):
+                yield {**response, 'response': ''.join(chunks)}
+            else:
+                yield response
+
+    async def _read_requests(self, reader: asyncio.StreamReader, queue: asyncio.Queue):
+        """Read request lines into the bounded pipeline queue"""
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (asyncio.LimitOverrunError, ValueError):
+                    await queue.put({'error': f"Request line longer than {self.max_line} bytes"})
+                    break
+                if not line:
+                    break
+                if line.strip():
+                    await queue.put(line)   # waits while the pipeline is full
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            await queue.put(_EOF)
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        loop = asyncio.get_running_loop()
+        peer = str(writer.get_extra_info('peername') or writer.get_extra_info('sockname'))
+
+        if self._closing or len(self._connections) >= self.max_connections:
+            writer.write(b'{"id": null, "error": "Server busy, try again"}\n')
+            await self._close_writer(writer)
+            return
+
+        self._connections.add(task)
+        session = ClientSession(peer)
+        self.sessions[session.session_id] = session
+        queue: asyncio.Queue = asyncio.Queue(self.max_pipeline)
+        read_task = asyncio.create_task(self._read_requests(reader, queue))
+        self._readers.add(read_task)
+        try:
+            while True:
+                item = await queue.get()
+                if item is _EOF:
+                    break
+                if isinstance(item, dict):
+                    responses = [{'id': None, **item}]
+                else:
+                    try:
+                        request = json.loads(item)
+                        if not isinstance(request, dict):
+                            raise ValueError("request must be a JSON object")
+                        if request.get('stream') and request.get('command') is None:
+                            responses = self.stream_request(request, session)
+                        elif (self.assistant.generator is not None and request.get('command') is None
+                              and request.get('render', True)):
+                            responses = self.collect_stream(request, session)
+                        else:
+                            responses = [self.handle_request(request, session)]
+                    except ValueError as e:
+                        responses = [{'id': None, 'error': f"Invalid request: {e}"}]
+                    except Exception as e:
+                        responses = [{'id': None, 'error': f"Internal error: {e}"}]
+                try:
+                    responses = iter(responses)
+                    blocking = False
+                    while True:
+                        if blocking:
+                            response = await loop.run_in_executor(None, next, responses, _EOF)
+                        else:
+                            response = next(responses, _EOF)
+                        if response is _EOF:
+                            break
+                        if response is _BLOCKING:
+                            blocking = True
+                            continue
+                        writer.write(json.dumps(response, ensure_ascii=False).encode('utf-8') + b'\n')
+                        # Wait here if the client is not reading its responses;
+                        # streamed chunks go out one by one
+                        await writer.drain()
+                except ConnectionError:
+                    raise
+                except Exception as e:
+                    # A streamed answer failed part-way through
+                    writer.write(json.dumps({'id': None, 'error': f"Internal error: {e}"}).encode('utf-8') + b'\n')
+                self.requests_served += 1
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            read_task.cancel()
+            self._readers.discard(read_task)
+            self._connections.discard(task)
+            self.sessions.pop(session.session_id, None)
+            await self._close_writer(writer)
+
+    @staticmethod
+    async def _close_writer(writer: asyncio.StreamWriter):
+        try:
+            writer.close()
+            await writer.wait_closed()
+        except (ConnectionError, OSError):
+            pass
+
+
+async def _open(host: str, port: int, path: str = None):
+    if path:
+        return await asyncio.open_unix_connection(path, limit=1 << 20)
+    return await asyncio.open_connection(host, port, limit=1 << 20)
+
+
+async def query_server(queries: List[str], host: str = '127.0.0.1', port: int = 8765,
+                       path: str = None, render: bool = True, stream: bool = False,
+                       context: bool = True) -> List[Dict]:
+    """Local client: pipeline queries over one connection and return the responses
+
+    The queries are turns of one conversation unless context is False.
+    Streamed responses are reassembled: the summary line gains the joined
+    'response' and a 'chunks' count.
+    """
+    reader, writer = await _open(host, port, path)
+    try:
+        for request_id, query in enumerate(queries):
+            request = {'id': request_id, 'query': query, 'render': render, 'stream': stream,
+                       'context': context}
+            writer.write(json.dumps(request).encode('utf-8') + b'\n')
+        await writer.drain()
+        if not stream:
+            return [json.loads(await reader.readline()) for _ in queries]
+
+        responses = []
+        for _ in queries:
+            chunks = []
+            while True:
+                message = json.loads(await reader.readline())
+                if 'chunk' not in message:
+                    break
+                chunks.append(message['chunk'])
+            if message.get('done'):
+                message['response'] = ''.join(chunks)
+                message['chunks'] = len(chunks)
+            responses.append(message)
+        return responses
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(fraction * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+async def _load_connection(host, port, path, queries, requests, depth, render, latencies):
+    """One load-generator client keeping up to depth requests in flight"""
+    reader, writer = await _open(host, port, path)
+    in_flight = asyncio.Semaphore(depth)
+    sent_at: Dict[int, float] = {}
+
+    async def receive():
+        for _ in range(requests):
+            response = json.loads(await reader.readline())
+            latencies.append(time.perf_counter() - sent_at.pop(response['id']))
+            in_flight.release()
+
+    receiver = asyncio.create_task(receive())
+    for request_id in range(requests):
+        await in_flight.acquire()
+        query = queries[request_id % len(queries)]
+        sent_at[request_id] = time.perf_counter()
+        # Unrelated queries, so each is analyzed alone rather than as a conversation
+        writer.write(json.dumps({'id': request_id, 'query': query, 'render': render,
+                                 'context': False}).encode() + b'\n')
+        await writer.drain()
+    await receiver
+    writer.close()
+    await writer.wait_closed()
+
+
+async def run_load(queries: List[str], host: str = '127.0.0.1', port: int = 8765,
+                   path: str = None, connections: int = 16, requests: int = 500,
+                   depth: int = 8, render: bool = True) -> Dict:
+    """Drive the server with concurrent pipelining clients and measure throughput"""
+    latencies: List[float] = []
+    start = time.perf_counter()
+    await asyncio.gather(*(_load_connection(host, port, path, queries, requests, depth,
+                                            render, latencies)
+                           for _ in range(connections)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'connections': connections,
+        'pipeline_depth': depth,
+        'requests': len(latencies),
+        'seconds': elapsed,
+        'queries_per_sec': len(latencies) / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'max_ms': (latencies[-1] if latencies else 0.0) * 1000,
+    }
+
+
+def print_load_report(report: Dict):
+    """Print a load-generator report"""
+    print("\n📈 CRISIS SERVER LOAD TEST")
+    print("="*60)
+    print(f"Clients: {report['connections']} x pipeline depth {report['pipeline_depth']}")
+    print(f"Requests: {report['requests']} in {report['seconds']:.2f}s")
+    print(f"Sustained: {report['queries_per_sec']:.0f} queries/sec")
+    print(f"Latency: p50 {report['p50_ms']:.2f} ms, p99 {report['p99_ms']:.2f} ms, "
+          f"max {report['max_ms']:.2f} ms")
+    print("="*60)
@@ -7,7 +7,125 @@ from typing import Dict, List
 # Emergency procedures database - Based on WHO and Red Cross guidelines
 # This simulates offline medical knowledge base for the Crisis Assistant
 
-from typing import Dict, List
+import os
+import time
+from contextlib import nullcontext
+from typing import Dict, List, Optional
+
+from kb_format import (DEFAULT_KB_PATH, KnowledgeBaseFile, LazyProcedures,
+                       compute_content_hash, read_procedure_file)
+from index_cache import DEFAULT_CACHE_DIR, discard_cached, load_cached, save_cached
+from keyword_matcher import KeywordIndex, KeywordMatcher
+from procedure_record import Procedure, intern_keywords, intern_strings, is_critical
+
+class KnowledgeSnapshot:
+    """
+    One consistent version of the procedures, keywords and derived indexes
+    A reload builds a new snapshot and swaps it in whole, so a query that
+    holds a snapshot sees a single version from start to finish
+    """
+    
+    def __init__(self, generation: int, procedures: Dict, keywords: Dict[str, List[str]],
+                 keyword_matcher: KeywordMatcher, keyword_index: KeywordIndex,
+                 content_hash: Optional[str] = None, critical_types: Optional[tuple] = None,
+                 critical_matcher: Optional[KeywordMatcher] = None,
+                 index_cache_dir: Optional[str] = None):
+        self.generation = generation
+        self.procedures = procedures
+        self.keywords = keywords
+        self.keyword_matcher = keyword_matcher
+        self.keyword_index = keyword_index
+        self._content_hash = content_hash
+        # Critical tier (CRITICAL or time-critical procedures) and its own
+        # small matcher, worked out on first use unless given
+        self._critical_types = critical_types
+        self._critical_matcher = critical_matcher
+        # Where derived indexes are cached between runs; None disables it
+        self._index_cache_dir = index_cache_dir
+        # Full-text and vector indexes are built on first use; they need NumPy
+        self._text_index = None
+        self._vector_index = None
+    
+    def get_procedure(self, emergency_type: str) -> Dict:
+        """Get complete procedure data for specific emergency type"""
+        return self.procedures.get(emergency_type, {})
+    
+    def get_all_procedures(self) -> Dict:
+        """Get all available procedures (a lazy mapping for compiled files)"""
+        return self.procedures
+    
+    def get_keywords(self) -> Dict[str, List[str]]:
+        """Get keyword mappings for query analysis"""
+        return self.keywords
+    
+    def get_keyword_matcher(self) -> KeywordMatcher:
+        """Get the compiled keyword matcher for single-pass query analysis"""
+        return self.keyword_matcher
+    
+    def search_by_keyword(self, keyword: str) -> List[str]:
+        """Find emergency types that match a specific keyword"""
+        return self.keyword_index.search(keyword)
+    
+    def get_critical_types(self) -> tuple:
+        """Emergency types in the critical tier, in knowledge-base order"""
+        if self._critical_types is None:
+            self._critical_types = tuple(t for t, procedure in self.procedures.items()
+                                         if is_critical(procedure))
+        return self._critical_types
+    
+    def get_critical_keywords(self) -> Dict[str, List[str]]:
+        """Keyword mappings of the critical tier only"""
+        return {t: self.keywords[t] for t in self.get_critical_types() if t in self.keywords}
+    
+    def get_critical_matcher(self) -> KeywordMatcher:
+        """Keyword matcher over the critical tier only, built on first use"""
+        if self._critical_matcher is None:
+            self._critical_matcher = KeywordMatcher(self.get_critical_keywords())
+        return self._critical_matcher
+    
+    def get_text_index(self):
+        """Get the BM25 index over full procedure text, building it on first use"""
+        if self._text_index is None:
+            from text_index import BM25Index
+            cache_dir = self._index_cache_dir
+            text_index = cache_dir and load_cached(cache_dir, 'text_index', self.content_hash())
+            if not isinstance(text_index, BM25Index) or text_index.types != list(self.procedures):
+                text_index = BM25Index(self.procedures, self.keywords)
+                if cache_dir:
+                    save_cached(cache_dir, 'text_index', self.content_hash(), text_index)
+            self._text_index = text_index
+        return self._text_index
+    
+    def search_procedures(self, query: str, top_k: int = 5) -> List[tuple]:
+        """Rank procedures by BM25 relevance of their full text to the query"""
+        return self.get_text_index().search(query, top_k)
+    
+    def content_hash(self) -> str:
+        """Hash of the procedures and keywords, used to validate cached indexes"""
+        if self._content_hash is None:
+            self._content_hash = compute_content_hash(self.procedures, self.keywords)
+        return self._content_hash
+    
+    def get_vector_index(self, cache_dir: str = None):
+        """Get the dense-vector index, memory-mapped from the index cache
+        (building it there if missing or stale) or, with the cache disabled
+        or not writable, built in memory"""
+        if self._vector_index is None:
+            from vector_index import VectorIndex
+            cache_dir = cache_dir or self._index_cache_dir
+            vector_index = None
+            if cache_dir:
+                content_hash = self.content_hash()
+                vector_index = VectorIndex.open(cache_dir, content_hash)
+                if vector_index is None:
+                    try:
+                        vector_index = VectorIndex.build(self.procedures, self.keywords,
+                                                         cache_dir, content_hash)
+                    except OSError:
+                        pass  # a read-only install still works, it just embeds at start
+            self._vector_index = vector_index or VectorIndex.in_memory(self.procedures,
+                                                                        self.keywords)
+        return self._vector_index
 
 class EmergencyDatabase:
     """
@@ -15,9 +133,284 @@ class EmergencyDatabase:
     Contains verified medical procedures from WHO, Red Cross, and AHA
     """
     
-    def __init__(self):
-        self.procedures = self._load_procedures()
-        self.keywords = self._load_keywords()
+    def __init__(self, kb_path: Optional[str] = None, data_dir: Optional[str] = None,
+                 index_cache_dir: Optional[str] = None, rebuild_index_cache: bool = False):
+        # Compiled knowledge-base file; None uses the built-in procedures
+        self.kb_path = kb_path
+        # Directory of editable procedure files; takes precedence over kb_path
+        self.data_dir = data_dir
+        # Where derived indexes are cached for a warm start; None disables it.
+        # rebuild_index_cache ignores what is there and writes it afresh
+        self.index_cache_dir = index_cache_dir
+        self.rebuild_index_cache = rebuild_index_cache
+        # Data-directory files loaded so far: name -> (mtime_ns, size, emergency_type)
+        self._data_files: Dict[str, tuple] = {}
+        self._type_files: Dict[str, str] = {}
+        # Serializes reloads; only needed when a watcher thread may run one
+        self._update_lock = None
+        self._watcher = None
+        self._stop_watching = None
+        # Summary of the most recent incremental update
+        self.last_update: Dict = {}
+        if data_dir:
+            import threading
+            self._update_lock = threading.Lock()
+        self._snapshot = self._load(generation=0)
+    
+    def snapshot(self) -> KnowledgeSnapshot:
+        """Current knowledge-base version; hold it for the length of a query"""
+        return self._snapshot
+    
+    @property
+    def generation(self) -> int:
+        """Bumped whenever the knowledge base changes, so caches can tell"""
+        return self._snapshot.generation
+    
+    @property
+    def procedures(self) -> Dict:
+        return self._snapshot.procedures
+    
+    @property
+    def keywords(self) -> Dict[str, List[str]]:
+        return self._snapshot.keywords
+    
+    @property
+    def keyword_matcher(self) -> KeywordMatcher:
+        return self._snapshot.keyword_matcher
+    
+    @property
+    def keyword_index(self) -> KeywordIndex:
+        return self._snapshot.keyword_index
+    
+    def _load(self, generation: int) -> KnowledgeSnapshot:
+        """Load procedures and keywords and build a snapshot from scratch"""
+        content_hash = None
+        critical_types = None
+        if self.data_dir:
+            procedures, keywords = self._read_data_dir()
+        elif self.kb_path:
+            # Only the header is parsed here; procedures decode on first access.
+            # The file stays mapped while older snapshots may still read it
+            kb_file = KnowledgeBaseFile(self.kb_path)
+            procedures = LazyProcedures(kb_file, Procedure.from_dict)
+            keywords = kb_file.keywords
+            content_hash = kb_file.content_hash
+            if kb_file.critical_types is not None:
+                critical_types = tuple(kb_file.critical_types)
+        else:
+            procedures = self._load_procedures()
+            keywords = self._load_keywords()
+        
+        # Compact records and interned keywords instead of dicts of lists
+        if not isinstance(procedures, LazyProcedures):
+            procedures = {t: Procedure.from_dict(p) for t, p in procedures.items()}
+        keywords = intern_keywords(keywords)
+        cache_dir = self.index_cache_dir
+        # The built-in procedures' keyword indexes build faster than a cache
+        # file loads; their full-text and vector indexes are still cached
+        if not cache_dir or not (self.data_dir or self.kb_path):
+            return KnowledgeSnapshot(generation, procedures, keywords,
+                                     KeywordMatcher(keywords), KeywordIndex(keywords), content_hash,
+                                     critical_types, index_cache_dir=cache_dir)
+        
+        if content_hash is None:
+            content_hash = compute_content_hash(procedures, keywords)
+        cached = None if self.rebuild_index_cache else load_cached(cache_dir, 'keyword_indexes',
+                                                                   content_hash)
+        # The hash ignores keyword-table order, which breaks score ties
+        if isinstance(cached, dict) and cached.get('types') == list(keywords):
+            return KnowledgeSnapshot(generation, procedures, keywords,
+                                     cached['keyword_matcher'], cached['keyword_index'],
+                                     content_hash, cached['critical_types'],
+                                     cached['critical_matcher'], cache_dir)
+        
+        # Cold start: build everything a query may need, then cache it.
+        # The full-text index is cached on first use; a rebuild drops it
+        if self.rebuild_index_cache:
+            discard_cached(cache_dir, 'text_index', content_hash)
+        snapshot = KnowledgeSnapshot(generation, procedures, keywords,
+                                     KeywordMatcher(keywords), KeywordIndex(keywords), content_hash,
+                                     critical_types, index_cache_dir=cache_dir)
+        snapshot.keyword_matcher.fuzzy_index()
+        snapshot.get_critical_matcher().fuzzy_index()
+        save_cached(cache_dir, 'keyword_indexes', content_hash, {
+            'types': list(keywords),
+            'keyword_matcher': snapshot.keyword_matcher,
+            'keyword_index': snapshot.keyword_index,
+            'critical_types': snapshot.get_critical_types(),
+            'critical_matcher': snapshot.get_critical_matcher(),
+        })
+        return snapshot
+    
+    def reload(self):
+        """Reload procedures and keywords and rebuild every derived index"""
+        with self._update_lock or nullcontext():
+            self._snapshot = self._load(self._snapshot.generation + 1)
+    
+    def _scan_data_dir(self) -> Dict[str, tuple]:
+        """Procedure files in the data directory: name -> (mtime_ns, size)"""
+        files = {}
+        with os.scandir(self.data_dir) as entries:
+            for entry in entries:
+                if entry.name.endswith('.json') and not entry.name.startswith('.'):
+                    stat = entry.stat()
+                    files[entry.name] = (stat.st_mtime_ns, stat.st_size)
+        return files
+    
+    def _read_data_dir(self) -> tuple:
+        """Read every procedure file, in file-name order"""
+        procedures, keywords = {}, {}
+        data_files, type_files = {}, {}
+        for name, signature in sorted(self._scan_data_dir().items()):
+            emergency_type, procedure, type_keywords = read_procedure_file(
+                os.path.join(self.data_dir, name))
+            if emergency_type in procedures:
+                raise ValueError(f"{name}: emergency type '{emergency_type}' "
+                                 f"is already defined by {type_files[emergency_type]}")
+            procedures[emergency_type] = procedure
+            keywords[emergency_type] = type_keywords
+            data_files[name] = signature + (emergency_type,)
+            type_files[emergency_type] = name
+        self._data_files, self._type_files = data_files, type_files
+        return procedures, keywords
+    
+    def check_for_changes(self) -> bool:
+        """Apply edits to the data directory since the last check; True if any
+        
+        Only changed, added and removed files are read, and only their
+        entries are updated in the keyword matcher and index, so the cost
+        scales with the change. The new snapshot is swapped in at once;
+        queries already running keep the one they started with. Procedures
+        added here go after existing ones; a full reload() restores file
+        name order. A file that fails to parse (for example, half written)
+        keeps its previous version and is read again on the next check.
+        """
+        if not self.data_dir:
+            return False
+        with self._update_lock:
+            start = time.perf_counter()
+            current = self._scan_data_dir()
+            changed = sorted(name for name, signature in current.items()
+                             if self._data_files.get(name, ())[:2] != signature)
+            removed = [name for name in self._data_files if name not in current]
+            if not changed and not removed:
+                return False
+            scanned = time.perf_counter()
+            
+            data_files, type_files = dict(self._data_files), dict(self._type_files)
+            # emergency_type -> (procedure, keywords), or None when removed
+            updates: Dict[str, Optional[tuple]] = {}
+            errors = []
+            for name in removed:
+                emergency_type = data_files.pop(name)[2]
+                type_files.pop(emergency_type, None)
+                updates[emergency_type] = None
+            for name in changed:
+                try:
+                    emergency_type, procedure, type_keywords = read_procedure_file(
+                        os.path.join(self.data_dir, name))
+                    # Field types are checked here, so a bad field is this
+                    # file's error rather than the whole update's
+                    record = Procedure.from_dict(procedure)
+                except (OSError, ValueError, TypeError) as e:
+                    errors.append(f"{name}: {e}")
+                    continue
+                owner = type_files.get(emergency_type)
+                if owner is not None and owner != name:
+                    errors.append(f"{name}: emergency type '{emergency_type}' "
+                                  f"is already defined by {owner}")
+                    continue
+                previous = data_files.get(name)
+                if previous is not None and previous[2] != emergency_type:
+                    # The file now defines a different type; drop the old one
+                    type_files.pop(previous[2], None)
+                    updates.setdefault(previous[2], None)
+                data_files[name] = current[name] + (emergency_type,)
+                type_files[emergency_type] = name
+                updates[emergency_type] = (record, intern_strings(type_keywords))
+            
+            if updates:
+                old = self._snapshot
+                procedures, keywords = dict(old.procedures), dict(old.keywords)
+                for emergency_type, update in updates.items():
+                    if update is None:
+                        procedures.pop(emergency_type, None)
+                        keywords.pop(emergency_type, None)
+                    else:
+                        procedures[emergency_type], keywords[emergency_type] = update
+                
+                self._snapshot = KnowledgeSnapshot(
+                    old.generation + 1, procedures, keywords,
+                    old.keyword_matcher.updated(keywords, old.keywords, updates),
+                    old.keyword_index.updated(keywords, old.keywords, updates),
+                    index_cache_dir=old._index_cache_dir,
+                    **self._updated_critical_tier(old, keywords, updates))
+                self._data_files, self._type_files = data_files, type_files
+            
+            self.last_update = {
+                'generation': self._snapshot.generation,
+                'updated': sorted(t for t, u in updates.items() if u is not None),
+                'removed': sorted(t for t, u in updates.items() if u is None),
+                'errors': errors,
+                # Finding changed files stats the whole directory; applying
+                # them costs in proportion to the change
+                'scan_seconds': scanned - start,
+                'seconds': time.perf_counter() - scanned,
+            }
+            return bool(updates)
+    
+    def _updated_critical_tier(self, old: KnowledgeSnapshot, keywords: Dict[str, List[str]],
+                               updates: Dict[str, Optional[tuple]]) -> Dict:
+        """Critical tier of the next snapshot, derived from the old one's if it
+        was already worked out; an edited type may join or leave the tier
+        
+        Types joining the tier go after the others, as types added to the
+        full keyword matcher do.
+        """
+        if old._critical_types is None:
+            return {}
+        joined = [t for t, update in updates.items() if update is not None and is_critical(update[0])]
+        critical_types = tuple([t for t in old._critical_types if t not in updates or t in joined] +
+                               [t for t in joined if t not in old._critical_types])
+        if old._critical_matcher is None:
+            return {'critical_types': critical_types}
+        
+        critical_keywords = {t: keywords[t] for t in critical_types if t in keywords}
+        changed = [t for t in updates if t in critical_keywords or t in old._critical_types]
+        return {'critical_types': critical_types,
+                'critical_matcher': old._critical_matcher.updated(
+                    critical_keywords, old.get_critical_keywords(), changed)}
+    
+    def watch(self, interval: float = 1.0):
+        """Poll the data directory for changes on a background thread"""
+        if not self.data_dir or self._watcher is not None:
+            return
+        import threading
+        self._stop_watching = threading.Event()
+        
+        def poll():
+            while not self._stop_watching.wait(interval):
+                try:
+                    self.check_for_changes()
+                except Exception as e:
+                    # The directory may be briefly missing while being
+                    # replaced; whatever the error, keep watching so later
+                    # edits are still applied
+                    self.last_update = {'errors': [f"{type(e).__name__}: {e}"]}
+        
+        self._watcher = threading.Thread(target=poll, name='kb-watcher', daemon=True)
+        self._watcher.start()
+    
+    @property
+    def watching(self) -> bool:
+        return self._watcher is not None
+    
+    def stop_watching(self):
+        """Stop the data-directory watcher, if running"""
+        if self._watcher is not None:
+            self._stop_watching.set()
+            self._watcher.join()
+            self._watcher = None
     
     def _load_procedures(self) -> Dict:
         """Load emergency procedures database"""
@@ -281,26 +674,78 @@ class EmergencyDatabase:
     
     def get_procedure(self, emergency_type: str) -> Dict:
         """Get complete procedure data for specific emergency type"""
-        return self.procedures.get(emergency_type, {})
+        return self._snapshot.get_procedure(emergency_type)
     
     def get_all_procedures(self) -> Dict:
-        """Get all available procedures"""
-        return self.procedures
+        """Get all available procedures (a lazy mapping for compiled files)"""
+        return self._snapshot.get_all_procedures()
     
     def get_keywords(self) -> Dict[str, List[str]]:
         """Get keyword mappings for query analysis"""
-        return self.keywords
+        return self._snapshot.get_keywords()
+    
+    def get_keyword_matcher(self) -> KeywordMatcher:
+        """Get the compiled keyword matcher for single-pass query analysis"""
+        return self._snapshot.get_keyword_matcher()
     
     def search_by_keyword(self, keyword: str) -> List[str]:
         """Find emergency types that match a specific keyword"""
-        matches = []
-        keyword_lower = keyword.lower()
-        
-        for emergency_type, keywords in self.keywords.items():
-            if any(keyword_lower in kw.lower() for kw in keywords):
-                matches.append(emergency_type)
-        
-        return matches
+        return self._snapshot.search_by_keyword(keyword)
+    
+    def get_critical_types(self) -> tuple:
+        """Emergency types in the critical tier, in knowledge-base order"""
+        return self._snapshot.get_critical_types()
+    
+    def get_critical_matcher(self) -> KeywordMatcher:
+        """Keyword matcher over the critical tier only, built on first use"""
+        return self._snapshot.get_critical_matcher()
+    
+    def get_text_index(self):
+        """Get the BM25 index over full procedure text, building it on first use"""
+        return self._snapshot.get_text_index()
+    
+    def search_procedures(self, query: str, top_k: int = 5) -> List[tuple]:
+        """Rank procedures by BM25 relevance of their full text to the query"""
+        return self._snapshot.search_procedures(query, top_k)
+    
+    def content_hash(self) -> str:
+        """Hash of the procedures and keywords, used to validate cached indexes"""
+        return self._snapshot.content_hash()
+    
+    def get_vector_index(self, cache_dir: str = None):
+        """Get the memory-mapped dense-vector index, building it if missing or stale"""
+        return self._snapshot.get_vector_index(cache_dir)
+
+# Shared database instance - built on first use rather than at import time
+_emergency_db = None
+
+def default_index_cache_dir() -> Optional[str]:
+    """Index cache directory: CRISIS_INDEX_CACHE if set (empty disables the
+    cache), else the cache directory next to this module"""
+    cache_dir = os.environ.get('CRISIS_INDEX_CACHE')
+    if cache_dir is None:
+        return DEFAULT_CACHE_DIR
+    return cache_dir or None
+
+def default_database_options() -> Dict:
+    """EmergencyDatabase arguments for the configured source: a data directory
+    if set, else the compiled knowledge base if present, else the built-in
+    procedures"""
+    kb_path = os.environ.get('CRISIS_KB_PATH')
+    if kb_path is None and os.path.exists(DEFAULT_KB_PATH):
+        kb_path = DEFAULT_KB_PATH
+    return {'kb_path': kb_path, 'data_dir': os.environ.get('CRISIS_DATA_DIR'),
+            'index_cache_dir': default_index_cache_dir()}
+
+def get_emergency_db() -> EmergencyDatabase:
+    """Get the shared database for the configured source"""
+    global _emergency_db
+    if _emergency_db is None:
+        _emergency_db = EmergencyDatabase(**default_database_options())
+    return _emergency_db
 
-# Database instance - can be imported by other modules
-emergency_db = EmergencyDatabase()
+def __getattr__(name: str):
+    # Keeps 'from emergency_database import emergency_db' working
+    if name == 'emergency_db':
+        return get_emergency_db()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
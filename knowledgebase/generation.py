@@ -0,0 +1,225 @@
+# generation.py
+# Local answer generation on top of the retrieved procedure: backend
+# interface, deterministic stand-in backend, prompt-prefix cache and
+# coalescing of identical in-flight requests
+#
+# A generation backend (e.g. TinyLlama or Phi-2 through a local runtime)
+# sees the prompt in two parts: a prefix built from the procedure, the same
+# for every query about it, and the query. The prefix is encoded once per
+# procedure and knowledge-base version and reused for every query.
+
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Dict, Mapping, Optional
+
+from query_cache import normalize_query
+
+# Seconds to wait for generated text before using the pre-rendered procedure
+GENERATION_TIMEOUT = 2.0
+
+PROMPT_INSTRUCTIONS = (
+    "You are an offline first-aid assistant. Answer the question using only "
+    "the procedure below. Be brief, give the most urgent action first and "
+    "never contradict the critical warnings.")
+
+
+def build_prompt_prefix(procedure: Mapping) -> str:
+    """Shared prompt context for every query about a procedure"""
+    lines = [PROMPT_INSTRUCTIONS, "", f"PROCEDURE: {procedure['title']}",
+             f"URGENCY: {procedure['urgency']}", "STEPS:"]
+    lines.extend(f"- {step}" for step in procedure['procedure'])
+    lines.append("CRITICAL WARNINGS:")
+    lines.extend(f"- {warning}" for warning in procedure['critical_warnings'])
+    lines.append("SEEK MEDICAL HELP IF:")
+    lines.extend(f"- {condition}" for condition in procedure['when_to_seek_help'])
+    return "\n".join(lines) + "\n"
+
+
+def build_prompt_suffix(query: str) -> str:
+    """Per-query end of the prompt, appended to the encoded prefix"""
+    return f"\nQUESTION: {query}\nANSWER:"
+
+
+class GenerationBackend(ABC):
+    """
+    Interface for a local text generator
+    encode_prefix() does the expensive, query-independent work on the
+    prompt prefix (for a language model: tokenizing it and filling the
+    attention cache); generate() continues from that state with one query.
+    Both are called from worker threads.
+    """
+
+    name = 'base'
+
+    @abstractmethod
+    def encode_prefix(self, prefix: str) -> object:
+        """Backend-specific encoded state of a prompt prefix"""
+
+    @abstractmethod
+    def generate(self, encoded_prefix: object, prompt_suffix: str) -> str:
+        """Answer text, continuing from an encoded prefix with the rest of the prompt"""
+
+
+class StandInBackend(GenerationBackend):
+    """
+    Deterministic stand-in for a language model, for testing
+    The "encoding" splits the prefix into tokens and picks out its steps
+    and warnings; the answer is built from them, so the same prefix and
+    query always give the same text. delay and prefix_delay add simulated
+    compute time to generate() and encode_prefix().
+    """
+
+    name = 'stand-in'
+
+    def __init__(self, delay: float = 0.0, prefix_delay: float = 0.0, steps: int = 3):
+        self.delay = delay
+        self.prefix_delay = prefix_delay
+        self.steps = steps
+        # Calls made, to check caching and coalescing
+        self.prefixes_encoded = 0
+        self.generations = 0
+
+    def encode_prefix(self, prefix: str) -> object:
+        self.prefixes_encoded += 1
+        if self.prefix_delay:
+            time.sleep(self.prefix_delay)
+        title, sections = '', {}
+        section = None
+        for line in prefix.splitlines():
+            if line.startswith('PROCEDURE: '):
+                title = line[len('PROCEDURE: '):]
+            elif line.endswith(':') and line.isupper():
+                section = sections.setdefault(line[:-1], [])
+            elif line.startswith('- ') and section is not None:
+                section.append(line[2:])
+        return (tuple(prefix.split()), title, tuple(sections.get('STEPS', ())),
+                tuple(sections.get('CRITICAL WARNINGS', ())))
+
+    def generate(self, encoded_prefix: object, prompt_suffix: str) -> str:
+        self.generations += 1
+        if self.delay:
+            time.sleep(self.delay)
+        _tokens, title, steps, warnings = encoded_prefix
+        query = prompt_suffix.split('QUESTION:', 1)[-1].split('\nANSWER:', 1)[0].strip()
+        lines = [f"For \"{query}\", follow {title}. Start now:"]
+        lines.extend(f"   {step}" for step in steps[:self.steps])
+        if len(steps) > self.steps:
+            lines.append(f"   Then continue with the remaining {len(steps) - self.steps} steps.")
+        if warnings:
+            lines.append(f"   Above all: {warnings[0]}")
+        return "\n".join(lines)
+
+
+# Backends selectable by name (--generator)
+GENERATION_BACKENDS = {
+    StandInBackend.name: StandInBackend,
+}
+
+
+class ResponseGenerator:
+    """
+    Runs a generation backend for the assistant
+    - Encoded prompt prefixes are kept per (knowledge-base version,
+      emergency type) in a small LRU, so a procedure's shared context is
+      processed once rather than on every query
+    - Identical requests (same procedure, same normalized query) that
+      arrive while one is being generated share that generation
+    - Generation runs on worker threads; callers wait for it only until a
+      deadline and otherwise fall back to the pre-rendered procedure
+    """
+
+    def __init__(self, backend: GenerationBackend, timeout: float = GENERATION_TIMEOUT,
+                 prefix_cache_size: int = 32, workers: int = 2):
+        self.backend = backend
+        self.timeout = timeout
+        self.prefix_cache_size = prefix_cache_size
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix='generate')
+        self._lock = threading.Lock()
+        self._prefixes: OrderedDict = OrderedDict()
+        self._in_flight: Dict[tuple, Future] = {}
+
+        self.prefix_hits = 0
+        self.prefix_misses = 0
+        self.requests = 0
+        self.coalesced = 0
+        self.timeouts = 0
+        self.errors = 0
+
+    def submit(self, generation: int, emergency_type: str, procedure: Mapping,
+               query: str) -> Future:
+        """Start (or join) generating an answer; the future resolves to its text"""
+        key = (generation, emergency_type, normalize_query(query))
+        with self._lock:
+            self.requests += 1
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future
+            future = self._executor.submit(self._generate, generation, emergency_type,
+                                           procedure, query)
+            self._in_flight[key] = future
+        # Outside the lock: the callback runs at once if the future is already done
+        future.add_done_callback(lambda done: self._finished(key, done))
+        return future
+
+    def result(self, future: Future, deadline: float) -> Optional[str]:
+        """Generated text, or None if it is not ready by deadline (time.monotonic()) or failed"""
+        try:
+            return future.result(max(deadline - time.monotonic(), 0.0))
+        except FutureTimeoutError:
+            with self._lock:
+                self.timeouts += 1
+        except Exception:
+            with self._lock:
+                self.errors += 1
+        return None
+
+    def _finished(self, key: tuple, future: Future):
+        with self._lock:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+
+    def _generate(self, generation: int, emergency_type: str, procedure: Mapping,
+                  query: str) -> str:
+        return self.backend.generate(self._encoded_prefix(generation, emergency_type, procedure),
+                                     build_prompt_suffix(query))
+
+    def _encoded_prefix(self, generation: int, emergency_type: str, procedure: Mapping) -> object:
+        key = (generation, emergency_type)
+        with self._lock:
+            encoded = self._prefixes.get(key)
+            if encoded is not None:
+                self._prefixes.move_to_end(key)
+                self.prefix_hits += 1
+                return encoded
+            self.prefix_misses += 1
+
+        # Encoded outside the lock; two first queries about the same
+        # procedure may both encode it, and the second result is kept
+        encoded = self.backend.encode_prefix(build_prompt_prefix(procedure))
+        with self._lock:
+            self._prefixes[key] = encoded
+            self._prefixes.move_to_end(key)
+            while len(self._prefixes) > self.prefix_cache_size:
+                self._prefixes.popitem(last=False)
+        return encoded
+
+    def stats(self) -> Dict:
+        return {
+            'backend': self.backend.name,
+            'requests': self.requests,
+            'coalesced': self.coalesced,
+            'timeouts': self.timeouts,
+            'errors': self.errors,
+            'prefix_hits': self.prefix_hits,
+            'prefix_misses': self.prefix_misses,
+            'prefixes_cached': len(self._prefixes),
+        }
+
+    def close(self):
+        """Stop the worker threads, abandoning generations nobody waits for"""
+        self._executor.shutdown(wait=False)
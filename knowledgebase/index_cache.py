@@ -0,0 +1,99 @@
+# index_cache.py
+# Warm-start cache of the indexes derived from the knowledge base
+#
+# File layout (one file per cached part and content, named by the content
+# hash, e.g. cache/keyword_indexes-0123456789abcdef.pickle):
+#   magic         4 bytes   b'EKI1'
+#   version       4 bytes   unsigned little-endian, INDEX_CACHE_VERSION
+#   content_hash  64 bytes  ASCII SHA-256 of the procedures and keywords
+#   payload       pickle of the derived structures
+# A file whose magic, version or content hash does not match is ignored and
+# rebuilt, so editing the procedures or upgrading the code never serves a
+# stale index. The cache holds only what this program wrote; do not point
+# it at files from elsewhere. Knowledge bases sharing a cache directory
+# (e.g. a data directory and an .ekb file) each keep their own files; only
+# the MAX_CACHED most recently written per part are kept.
+
+import os
+import struct
+from typing import Optional
+
+MAGIC = b'EKI1'
+_HEADER = struct.Struct('<4sI64s')
+
+# Bump when a cached class changes shape, so old caches are rebuilt
+INDEX_CACHE_VERSION = 2
+
+# Contents cached per part before the oldest are removed
+MAX_CACHED = 4
+
+# Default cache location, shared with the dense-vector index
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache')
+
+
+def cache_path(cache_dir: str, name: str, content_hash: str) -> str:
+    """Location of one cached part for one content hash"""
+    return os.path.join(cache_dir, f"{name}-{content_hash[:16]}.pickle")
+
+
+def load_cached(cache_dir: str, name: str, content_hash: str) -> Optional[object]:
+    """The cached part for this content hash, or None if missing, stale or unreadable"""
+    import mmap, pickle  # only needed here; keeps module import fast
+    try:
+        with open(cache_path(cache_dir, name, content_hash), 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                if len(mapped) < _HEADER.size:
+                    return None
+                magic, version, cached_hash = _HEADER.unpack_from(mapped, 0)
+                if (magic != MAGIC or version != INDEX_CACHE_VERSION
+                        or cached_hash != content_hash.encode('ascii')):
+                    return None
+                # Unpickled straight from the mapping, without copying the file
+                with memoryview(mapped) as view, view[_HEADER.size:] as payload:
+                    return pickle.loads(payload)
+    except (OSError, ValueError, EOFError, AttributeError, ImportError, pickle.UnpicklingError):
+        return None
+
+
+def discard_cached(cache_dir: str, name: str, content_hash: str):
+    """Remove a cached part so it is rebuilt on next use"""
+    try:
+        os.remove(cache_path(cache_dir, name, content_hash))
+    except OSError:
+        pass
+
+
+def save_cached(cache_dir: str, name: str, content_hash: str, payload: object):
+    """Write a cached part; failures only cost the next start a rebuild"""
+    import pickle, tempfile
+    path = cache_path(cache_dir, name, content_hash)
+    tmp_path = None
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Written next to the target and swapped in, so readers never see a
+        # partial file; each writer (e.g. batch worker) has its own temp file
+        fd, tmp_path = tempfile.mkstemp(prefix=f"{name}.", suffix='.tmp', dir=cache_dir)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(_HEADER.pack(MAGIC, INDEX_CACHE_VERSION, content_hash.encode('ascii')))
+            pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        _prune(cache_dir, name)
+    except OSError:
+        # A read-only install still works, it just starts cold
+        if tmp_path:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+
+def _prune(cache_dir: str, name: str):
+    """Remove all but the MAX_CACHED most recently written files of a part"""
+    try:
+        entries = [entry for entry in os.scandir(cache_dir)
+                   if entry.name.startswith(f"{name}-") and entry.name.endswith('.pickle')]
+        entries.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+        for entry in entries[MAX_CACHED:]:
+            os.remove(entry.path)
+    except OSError:
+        pass  # another process pruned first; nothing is lost
@@ -0,0 +1,189 @@
+# kb_format.py
+# Compiled on-disk knowledge-base format with lazy procedure loading
+#
+# File layout:
+#   magic        4 bytes   b'EKB1'
+#   header_size  4 bytes   unsigned little-endian
+#   header       JSON      {"content_hash", "keywords", "index": {type: [offset, size]},
+#                           "critical": [types in the critical tier]}
+#   records      JSON      one compact record per procedure, offsets relative
+#                          to the end of the header
+#
+# Data directories hold one editable JSON file per procedure instead:
+#   {"type": "bleeding", "keywords": [...], "title": ..., "procedure": [...], ...}
+# "type" defaults to the file name without .json; procedures are ordered by
+# file name.
+
+import json
+import mmap
+import os
+import struct
+import sys
+from collections.abc import Mapping
+from typing import Callable, Dict, Iterator, List, Optional
+
+from procedure_record import is_critical
+
+MAGIC = b'EKB1'
+_PREFIX = struct.Struct('<4sI')
+
+# Default compiled knowledge base, used by the shared database instance if present
+DEFAULT_KB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'emergency_kb.ekb')
+
+
+def compute_content_hash(procedures: Dict[str, Dict], keywords: Dict[str, List[str]]) -> str:
+    """Hash of the procedures and keywords, used to validate cached indexes"""
+    import hashlib  # only needed here; keeps module import fast
+    # Records and tuples serialize exactly like the dicts and lists they replace
+    content = json.dumps([{t: dict(p) for t, p in procedures.items()}, keywords], sort_keys=True)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def compile_knowledge_base(procedures: Dict[str, Dict], keywords: Dict[str, List[str]], path: str):
+    """Write procedures and keywords to a compiled knowledge-base file"""
+    records = []
+    index = {}
+    offset = 0
+    for emergency_type, procedure in procedures.items():
+        record = json.dumps(dict(procedure), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        index[emergency_type] = [offset, len(record)]
+        records.append(record)
+        offset += len(record)
+
+    header = json.dumps({
+        'content_hash': compute_content_hash(procedures, keywords),
+        'keywords': keywords,
+        'index': index,
+        # Lets the critical tier be indexed without decoding every record
+        'critical': [t for t, procedure in procedures.items() if is_critical(procedure)],
+    }, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    # Write next to the target and swap in, so readers never see a partial file
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(_PREFIX.pack(MAGIC, len(header)))
+        f.write(header)
+        for record in records:
+            f.write(record)
+    os.replace(tmp_path, path)
+
+
+def read_procedure_file(path: str) -> tuple:
+    """Parse one data-directory file into (emergency_type, procedure, keywords)"""
+    with open(path, encoding='utf-8') as f:
+        record = json.load(f)
+    if not isinstance(record, dict):
+        raise ValueError(f"{path}: expected a JSON object")
+    emergency_type = record.pop('type', None) or os.path.splitext(os.path.basename(path))[0]
+    keywords = record.pop('keywords', [])
+    if not isinstance(keywords, list) or not all(isinstance(kw, str) for kw in keywords):
+        raise ValueError(f"{path}: 'keywords' must be a list of strings")
+    return emergency_type, record, keywords
+
+
+def write_data_dir(procedures: Dict[str, Dict], keywords: Dict[str, List[str]], directory: str):
+    """Write one JSON file per procedure, numbered to keep the table order"""
+    os.makedirs(directory, exist_ok=True)
+    width = max(4, len(str(len(procedures))))
+    for number, (emergency_type, procedure) in enumerate(procedures.items(), 1):
+        record = {'type': emergency_type, 'keywords': list(keywords.get(emergency_type, [])),
+                  **procedure}
+        path = os.path.join(directory, f"{number:0{width}d}_{emergency_type}.json")
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(record, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+
+class KnowledgeBaseFile:
+    """
+    Read-only view of a compiled knowledge-base file through mmap
+    The header (keywords and record index) is parsed on open; procedure
+    records are decoded only when asked for
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            try:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise ValueError(f"{path} is not a compiled knowledge base")
+
+        if len(self._map) < _PREFIX.size:
+            raise ValueError(f"{path} is not a compiled knowledge base")
+        magic, header_size = _PREFIX.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a compiled knowledge base")
+
+        header = json.loads(self._map[_PREFIX.size:_PREFIX.size + header_size])
+        self.content_hash: str = header['content_hash']
+        self.keywords: Dict[str, List[str]] = header['keywords']
+        self.index: Dict[str, List[int]] = header['index']
+        # Critical-tier types; None for files compiled before it was recorded
+        self.critical_types: Optional[List[str]] = header.get('critical')
+        self._records_start = _PREFIX.size + header_size
+
+    def read_procedure(self, emergency_type: str) -> Dict:
+        """Decode one procedure record"""
+        offset, size = self.index[emergency_type]
+        start = self._records_start + offset
+        return json.loads(self._map[start:start + size])
+
+    def close(self):
+        """Release the memory map"""
+        self._map.close()
+
+
+class LazyProcedures(Mapping):
+    """
+    Mapping of emergency type to procedure backed by a compiled file
+    Each procedure is decoded on first access, passed through decode and
+    kept afterwards
+    """
+
+    def __init__(self, kb_file: KnowledgeBaseFile, decode: Callable[[Dict], Mapping] = None):
+        self._file = kb_file
+        self._decode = decode
+        self._decoded: Dict[str, Mapping] = {}
+
+    def __getitem__(self, emergency_type: str) -> Dict:
+        procedure = self._decoded.get(emergency_type)
+        if procedure is None:
+            if emergency_type not in self._file.index:
+                raise KeyError(emergency_type)
+            procedure = self._file.read_procedure(emergency_type)
+            if self._decode is not None:
+                procedure = self._decode(procedure)
+            self._decoded[emergency_type] = procedure
+        return procedure
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._file.index)
+
+    def __len__(self) -> int:
+        return len(self._file.index)
+
+    def __contains__(self, emergency_type) -> bool:
+        return emergency_type in self._file.index
+
+    def decoded_count(self) -> int:
+        """Number of procedures decoded so far"""
+        return len(self._decoded)
+
+
+if __name__ == "__main__":
+    # Compile the built-in procedures: python kb_format.py [output.ekb]
+    # Or export them as an editable data directory: python kb_format.py --export-dir DIR
+    from emergency_database import EmergencyDatabase
+
+    source = EmergencyDatabase(kb_path=None)
+    if len(sys.argv) > 2 and sys.argv[1] == '--export-dir':
+        write_data_dir(source.procedures, source.keywords, sys.argv[2])
+        print(f"✅ Exported {len(source.procedures)} procedures to {sys.argv[2]}")
+        sys.exit(0)
+
+    output_path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_KB_PATH
+    compile_knowledge_base(source.procedures, source.keywords, output_path)
+    print(f"✅ Compiled {len(source.procedures)} procedures to {output_path} "
+          f"({os.path.getsize(output_path)} bytes)")
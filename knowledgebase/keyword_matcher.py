@@ -0,0 +1,549 @@
+# keyword_matcher.py
+# Compiled keyword lookups (single-pass matcher, substring index) for query analysis
+
+import heapq
+import re
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# Query words considered for typo-tolerant matching
+_WORD_PATTERN = re.compile(r"[^\W\d_]+")
+
+# Everyday words that are never typo-corrected: each is a near miss of a
+# first-aid keyword ("could" -> "cold", "turned" -> "burned", "found" -> "wound")
+COMMON_WORDS = frozenset("""
+    about after again because before being below bound bread brought called
+    cheat chose chore cooking could doing during every found going ground
+    heard hears hearth heath house looking might mound never other pound
+    round scale scold should sound stack stock their there these thing
+    think those though thought turned turning under until where which
+    while would
+""".split())
+
+
+def _build_automaton(patterns: List[str], first_id: int = 0) -> tuple:
+    """Build the goto, failure and output tables for patterns
+
+    Pattern ids in the output table start at first_id.
+    """
+    goto: List[Dict[str, int]] = [{}]
+    output: List[List[int]] = [[]]
+
+    for pattern_id, pattern in enumerate(patterns, first_id):
+        state = 0
+        for ch in pattern:
+            next_state = goto[state].get(ch)
+            if next_state is None:
+                next_state = len(goto)
+                goto[state][ch] = next_state
+                goto.append({})
+                output.append([])
+            state = next_state
+        output[state].append(pattern_id)
+
+    # Breadth-first pass to link each state to its longest proper
+    # suffix state and inherit that state's outputs
+    fail = [0] * len(goto)
+    queue = list(goto[0].values())
+    for state in queue:
+        for ch, next_state in goto[state].items():
+            queue.append(next_state)
+            fallback = fail[state]
+            while fallback and ch not in goto[fallback]:
+                fallback = fail[fallback]
+            fail[next_state] = goto[fallback].get(ch, 0)
+            output[next_state].extend(output[fail[next_state]])
+
+    return goto, fail, [tuple(ids) for ids in output]
+
+
+def _substrings(keywords: Iterable[str]) -> Set[str]:
+    """Every non-empty substring of the lowercased keywords"""
+    substrings = set()
+    for keyword in {kw.lower() for kw in keywords}:
+        for start in range(len(keyword)):
+            for end in range(start + 1, len(keyword) + 1):
+                substrings.add(keyword[start:end])
+    return substrings
+
+
+def _deletions(word: str, depth: int) -> Set[str]:
+    """The word and every string made by deleting up to depth characters"""
+    result = {word}
+    frontier = {word}
+    for _ in range(depth):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+        result |= frontier
+    return result
+
+
+def _edit_distance(a: str, b: str, limit: int) -> int:
+    """Damerau-Levenshtein (optimal string alignment) distance, or limit + 1
+    as soon as the distance is known to exceed limit"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous_row = None
+    row = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        earlier_row, previous_row = previous_row, row
+        row = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            row[j] = min(previous_row[j] + 1, row[j - 1] + 1, previous_row[j - 1] + cost)
+            if (i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]):
+                row[j] = min(row[j], earlier_row[j - 2] + 1)
+        if min(row) > limit:
+            return limit + 1
+    return row[-1]
+
+
+class FuzzyKeywordIndex:
+    """
+    SymSpell-style deletion index over single-word keywords
+    Each keyword is stored under every string made by deleting up to one
+    (short words) or two characters. A query word is looked up by its own
+    deletions, so finding near-misses costs a bounded number of dict
+    lookups however many keywords there are; candidates are then checked
+    with a true edit distance. Entries are only ever added, so the index
+    can be shared with matchers derived by KeywordMatcher.updated()
+    """
+
+    MIN_WORD_LENGTH = 5     # shorter query words are too ambiguous to correct
+    MAX_WORD_LENGTH = 24    # longer ones are not words a user typed by hand
+    # Shorter words are one changed letter from other real words too often
+    # ("heard" / "heart", "bread" / "break"); they may still drop, add or swap one
+    MIN_SUBSTITUTION_LENGTH = 6
+
+    def __init__(self):
+        self._deletes: Dict[str, tuple] = {}
+
+    @staticmethod
+    def max_distance(length: int) -> int:
+        """Edits allowed for a word of this length"""
+        return 1 if length < 8 else 2
+
+    def add(self, keyword: str, pattern_id: int):
+        """Index a keyword, if it is a single word that typos can be matched to"""
+        if len(keyword) < self.MIN_WORD_LENGTH - 1 or not keyword.isalpha():
+            return
+        # Words of six or more letters can be two edits from an eight-letter query word
+        for deletion in _deletions(keyword, 2 if len(keyword) >= 6 else 1):
+            # Tuples are replaced, never extended in place, so lookups on
+            # other threads always see a complete entry
+            self._deletes[deletion] = self._deletes.get(deletion, ()) + (pattern_id,)
+
+    def lookup(self, word: str, patterns: List[str]) -> List[tuple]:
+        """(pattern_id, distance) of keywords within the allowed edits of word"""
+        if (not self.MIN_WORD_LENGTH <= len(word) <= self.MAX_WORD_LENGTH
+                or word in COMMON_WORDS):
+            return []
+        limit = self.max_distance(len(word))
+        candidates = set()
+        for deletion in _deletions(word, limit):
+            candidates.update(self._deletes.get(deletion, ()))
+
+        matches = []
+        for pattern_id in candidates:
+            # Ids added for newer matchers are not part of this one
+            if pattern_id >= len(patterns):
+                continue
+            pattern = patterns[pattern_id]
+            distance = _edit_distance(word, pattern, limit)
+            if distance > limit:
+                continue
+            # One edit between words of equal length is a substitution unless
+            # the letters are merely swapped
+            if (distance == 1 and len(word) == len(pattern) < self.MIN_SUBSTITUTION_LENGTH
+                    and sorted(word) != sorted(pattern)):
+                continue
+            matches.append((pattern_id, distance))
+        return matches
+
+
+class KeywordMatcher:
+    """
+    Aho-Corasick automaton compiled from the emergency keyword table
+    Finds every keyword hit, and whether it sits on word boundaries,
+    in one pass over the query
+    """
+
+    # Score weights for a keyword hit
+    EXACT_WEIGHT = 3      # keyword is the whole (stripped) query
+    WORD_WEIGHT = 2       # keyword is bounded by spaces or the query ends
+    PARTIAL_WEIGHT = 1    # keyword appears inside other text
+    # Hits for a misspelled keyword ("bleding", "chokng"): a correction
+    # counts as the word it corrects, a misspelled whole query a little
+    # less than an exact one
+    FUZZY_EXACT_WEIGHT = 2.5  # the misspelled word is the whole query
+    FUZZY_WEIGHT = 2          # the misspelled word is one word of the query
+    # Confidence ceiling for a type hit only through weak corrections (two
+    # edits away): below the assistant's MIN_CONFIDENCE, so these add to
+    # other hits but never select a procedure on their own
+    MAX_TYPO_CONFIDENCE = 0.04
+
+    # Query words remembered with their typo-tolerant matches
+    FUZZY_CACHE_SIZE = 4096
+
+    # New keywords kept in the secondary automaton before a full rebuild
+    MAX_ADDED_PATTERNS = 256
+
+    def __init__(self, keywords: Dict[str, List[str]], fuzzy: bool = True):
+        # Whether query words that are not keywords are matched to near-miss keywords
+        self.fuzzy = fuzzy
+        self.types = list(keywords)
+        self._type_index = {t: i for i, t in enumerate(self.types)}
+        self._next_type_index = len(self.types)
+        # Normalization constant per type: the score of an exact hit on
+        # every one of its keywords
+        self.max_scores = {t: len(type_keywords) * self.EXACT_WEIGHT
+                           for t, type_keywords in keywords.items()}
+
+        # Distinct keyword strings; a keyword listed under several
+        # emergency types is matched once and credited to each of them
+        self.patterns: List[str] = []
+        self.pattern_types: List[List[str]] = []
+        self._pattern_ids: Dict[str, int] = {}
+        for emergency_type, type_keywords in keywords.items():
+            for keyword in type_keywords:
+                # Empty keywords would match every query; they are ignored
+                if not keyword:
+                    continue
+                pattern_id = self._pattern_ids.get(keyword)
+                if pattern_id is None:
+                    pattern_id = len(self.patterns)
+                    self._pattern_ids[keyword] = pattern_id
+                    self.patterns.append(keyword)
+                    self.pattern_types.append([])
+                self.pattern_types[pattern_id].append(emergency_type)
+
+        self._lengths = [len(p) for p in self.patterns]
+        # One automaton over every pattern; incremental updates add a
+        # second, small one for patterns added since
+        self._base_count = len(self.patterns)
+        self._automata = [_build_automaton(self.patterns)]
+        # Deletion index, built on first use
+        self._fuzzy_index = None
+        self._fuzzy_cache: Dict[str, tuple] = {}
+        # (first type, its index, next type index) per pattern, filled on use
+        self._pattern_order: Dict[int, tuple] = {}
+
+    def updated(self, keywords: Dict[str, List[str]], previous: Dict[str, List[str]],
+                changed_types: Iterable[str]) -> 'KeywordMatcher':
+        """Matcher for keywords, which differ from previous only in changed_types
+
+        The compiled automaton is shared with this matcher and keywords not
+        seen before are compiled into a second automaton of their own, so
+        the work done scales with the change. This matcher is not modified.
+        """
+        matcher = KeywordMatcher.__new__(KeywordMatcher)
+        matcher.fuzzy = self.fuzzy
+        matcher.types = list(keywords)
+        matcher._type_index = dict(self._type_index)
+        matcher._next_type_index = self._next_type_index
+        matcher.max_scores = dict(self.max_scores)
+        matcher.patterns = list(self.patterns)
+        matcher.pattern_types = list(self.pattern_types)
+        matcher._pattern_ids = dict(self._pattern_ids)
+        matcher._lengths = list(self._lengths)
+        matcher._base_count = self._base_count
+
+        pattern_ids, pattern_types = matcher._pattern_ids, matcher.pattern_types
+        for emergency_type in changed_types:
+            # Type lists are replaced rather than modified in place: they
+            # are shared with the previous matcher
+            for keyword in set(previous.get(emergency_type, ())):
+                pattern_id = pattern_ids.get(keyword)
+                if pattern_id is not None:
+                    pattern_types[pattern_id] = [t for t in pattern_types[pattern_id]
+                                                 if t != emergency_type]
+
+            if emergency_type not in keywords:
+                matcher._type_index.pop(emergency_type, None)
+                matcher.max_scores.pop(emergency_type, None)
+                continue
+            matcher.max_scores[emergency_type] = len(keywords[emergency_type]) * self.EXACT_WEIGHT
+            if emergency_type not in matcher._type_index:
+                # New types rank last, matching their place in the keyword table
+                matcher._type_index[emergency_type] = matcher._next_type_index
+                matcher._next_type_index += 1
+            for keyword in keywords[emergency_type]:
+                if not keyword:
+                    continue
+                pattern_id = pattern_ids.get(keyword)
+                if pattern_id is None:
+                    pattern_id = len(matcher.patterns)
+                    pattern_ids[keyword] = pattern_id
+                    matcher.patterns.append(keyword)
+                    matcher._lengths.append(len(keyword))
+                    pattern_types.append([])
+                pattern_types[pattern_id] = pattern_types[pattern_id] + [emergency_type]
+
+        added = len(matcher.patterns) - self._base_count
+        if added > max(self.MAX_ADDED_PATTERNS, self._base_count // 8):
+            return KeywordMatcher(keywords, self.fuzzy)
+        matcher._automata = self._automata[:1]
+        if added:
+            matcher._automata.append(_build_automaton(matcher.patterns[self._base_count:],
+                                                      self._base_count))
+
+        # The deletion index only grows; share it and add the new keywords
+        matcher._fuzzy_index = self._fuzzy_index
+        matcher._fuzzy_cache = {}
+        matcher._pattern_order = {}
+        if matcher._fuzzy_index is not None:
+            for pattern_id in range(len(self.patterns), len(matcher.patterns)):
+                matcher._fuzzy_index.add(matcher.patterns[pattern_id], pattern_id)
+        return matcher
+
+    def find(self, text: str) -> Dict[int, float]:
+        """Return the best weight of every keyword found in text, by pattern id"""
+        return self._hits(text)[0]
+
+    def _hits(self, text: str) -> tuple:
+        """find() and the set of pattern ids hit only through weak corrections"""
+        lengths = self._lengths
+        last = len(text) - 1
+        weights: Dict[int, int] = {}
+
+        for goto, fail, output in self._automata:
+            state = 0
+            for i, ch in enumerate(text):
+                while state and ch not in goto[state]:
+                    state = fail[state]
+                state = goto[state].get(ch, 0)
+                for pattern_id in output[state]:
+                    if weights.get(pattern_id, 0) >= self.WORD_WEIGHT:
+                        continue
+                    start = i - lengths[pattern_id] + 1
+                    if ((start == 0 or text[start - 1] == ' ') and
+                            (i == last or text[i + 1] == ' ')):
+                        weights[pattern_id] = self.WORD_WEIGHT
+                    else:
+                        weights[pattern_id] = self.PARTIAL_WEIGHT
+
+        exact_id = self._pattern_ids.get(text.strip())
+        if exact_id is not None:
+            weights[exact_id] = self.EXACT_WEIGHT
+
+        weak_ids = self._add_fuzzy_hits(text, weights) if self.fuzzy else set()
+        return weights, weak_ids
+
+    def _add_fuzzy_hits(self, text: str, weights: Dict[int, float]) -> Set[int]:
+        """Credit the closest keywords to query words that are not keywords themselves
+
+        Returns the ids of keywords hit only through weak corrections, two
+        edits away.
+        """
+        weak_ids, strong_ids = set(), set()
+        words = _WORD_PATTERN.findall(text)
+        whole_query = len(words) == 1 and words[0] == text.strip()
+        weight = self.FUZZY_EXACT_WEIGHT if whole_query else self.FUZZY_WEIGHT
+        for word in words:
+            if len(word) < FuzzyKeywordIndex.MIN_WORD_LENGTH or word in self._pattern_ids:
+                continue
+            distance, pattern_ids = self._fuzzy_matches(word)
+            if not pattern_ids:
+                continue
+            weak = distance > 1
+            for pattern_id in pattern_ids:
+                if pattern_id not in weights:
+                    (weak_ids if weak else strong_ids).add(pattern_id)
+                elif not weak:
+                    strong_ids.add(pattern_id)
+                if weights.get(pattern_id, 0) < weight:
+                    weights[pattern_id] = weight
+        return weak_ids - strong_ids
+
+    def fuzzy_index(self) -> FuzzyKeywordIndex:
+        """Deletion index over the keywords, built on first use"""
+        if self._fuzzy_index is None:
+            self._fuzzy_index = FuzzyKeywordIndex()
+            for pattern_id, pattern in enumerate(self.patterns):
+                self._fuzzy_index.add(pattern, pattern_id)
+        return self._fuzzy_index
+
+    def __getstate__(self) -> Dict:
+        # Pickled for the index cache; remembered query words are not kept
+        state = self.__dict__.copy()
+        state['_fuzzy_cache'] = {}
+        return state
+
+    def _fuzzy_matches(self, word: str) -> tuple:
+        """(distance, ids) of the keywords closest to word, remembered per word"""
+        matches = self._fuzzy_cache.get(word)
+        if matches is None:
+            # Keywords removed by an update keep their ids but credit no type
+            found = [(distance, pattern_id) for pattern_id, distance
+                     in self.fuzzy_index().lookup(word, self.patterns)
+                     if self.pattern_types[pattern_id]]
+            closest = min(found)[0] if found else None
+            matches = (closest, tuple(sorted(pattern_id for distance, pattern_id in found
+                                             if distance == closest)))
+            if len(self._fuzzy_cache) >= self.FUZZY_CACHE_SIZE:
+                self._fuzzy_cache.clear()
+            self._fuzzy_cache[word] = matches
+        return matches
+
+    def leading_confidence(self, text: str, emergency_type: str) -> Optional[float]:
+        """emergency_type's confidence if it is certain to rank first for text, else None
+
+        Decided from the keyword hits, without scoring every type they
+        credit: no other type can score more than the summed weight of the
+        hits that credit any type but this one. The type must beat that
+        bound, or equal it when every such type ranks after it on ties.
+        """
+        type_index = self._type_index
+        own_index = type_index.get(emergency_type)
+        if own_index is None:
+            return None
+        weights, weak_ids = self._hits(text)
+        own = rival = 0
+        exact = ties_lose = False
+        for pattern_id, weight in weights.items():
+            order = self._pattern_order.get(pattern_id)
+            if order is None:
+                indexes = sorted((type_index[t], t) for t in self.pattern_types[pattern_id])
+                order = ((indexes[0][1], indexes[0][0], indexes[1][0] if len(indexes) > 1 else None)
+                         if indexes else (None, None, None))
+                self._pattern_order[pattern_id] = order
+            first_type, first_index, next_index = order
+            if first_type is None:
+                continue
+            if first_type == emergency_type:
+                credited, rival_index = True, next_index
+            else:
+                credited = (next_index is not None and
+                            emergency_type in self.pattern_types[pattern_id])
+                rival_index = first_index
+            if credited:
+                own += weight
+                exact = exact or pattern_id not in weak_ids
+            if rival_index is not None:
+                rival += weight
+                ties_lose = ties_lose or rival_index < own_index
+        # A type hit only through weak corrections ranks after the rest
+        if not exact or own < rival or (own == rival and ties_lose):
+            return None
+        return min(own / self.max_scores[emergency_type], 1.0)
+
+    def _raw_scores(self, text: str) -> tuple:
+        """Summed hit weights per emergency type, in no particular order, and
+        the set of types hit only through weak corrections"""
+        weights, weak_ids = self._hits(text)
+        scores: Dict[str, float] = {}
+        exact_types = set()
+        for pattern_id, weight in weights.items():
+            for emergency_type in self.pattern_types[pattern_id]:
+                scores[emergency_type] = scores.get(emergency_type, 0) + weight
+                if pattern_id not in weak_ids:
+                    exact_types.add(emergency_type)
+        return scores, scores.keys() - exact_types
+
+    def score(self, text: str) -> Dict[str, float]:
+        """Score each emergency type with at least one keyword hit in text"""
+        scores = self._raw_scores(text)[0]
+        # Keep keyword-table order so ties resolve the same way as before
+        return dict(sorted(scores.items(), key=lambda item: self._type_index[item[0]]))
+
+    def rank(self, text: str, top_k: int = 3) -> List[Tuple[str, float]]:
+        """The top_k emergency types for text as (type, confidence), best first
+
+        Types are ranked by score, ties going to the earlier type in the
+        keyword table; confidence is the score over the type's maximum.
+        Types hit only through weak corrections rank after the rest, with
+        confidence at most MAX_TYPO_CONFIDENCE. Only the top_k are
+        selected, the rest are never sorted.
+        """
+        type_index, max_scores = self._type_index, self.max_scores
+        scores, weak_types = self._raw_scores(text)
+        best = heapq.nlargest(top_k, scores.items(),
+                              key=lambda item: (item[0] not in weak_types, item[1],
+                                                -type_index[item[0]]))
+        return [(emergency_type,
+                 min(score / max_scores[emergency_type],
+                     self.MAX_TYPO_CONFIDENCE if emergency_type in weak_types else 1.0))
+                for emergency_type, score in best]
+
+
+class KeywordIndex:
+    """
+    Inverted index from every substring of every keyword to the emergency
+    types listing that keyword, for constant-time keyword searches
+    """
+
+    def __init__(self, keywords: Dict[str, List[str]]):
+        index: Dict[str, set] = {}
+        for type_index, type_keywords in enumerate(keywords.values()):
+            # Tokens, prefixes and every other substring of the keyword
+            for substring in _substrings(type_keywords):
+                index.setdefault(substring, set()).add(type_index)
+
+        # The empty string is a substring of any keyword
+        types = list(keywords)
+        index[''] = {i for i, type_keywords in enumerate(keywords.values()) if type_keywords}
+
+        # Many substrings share the same set of types; store each result once
+        shared: Dict[frozenset, tuple] = {}
+        self._index: Dict[str, tuple] = {}
+        for substring, type_ids in index.items():
+            key = frozenset(type_ids)
+            if key not in shared:
+                shared[key] = tuple(types[i] for i in sorted(type_ids))
+            self._index[substring] = shared[key]
+
+        # Entries changed by incremental updates, consulted before _index
+        self._overlay: Dict[str, tuple] = {}
+        self._type_order = {t: i for i, t in enumerate(types)}
+        self._next_type_order = len(types)
+
+    def _lookup(self, substring: str) -> tuple:
+        result = self._overlay.get(substring)
+        if result is None:
+            result = self._index.get(substring, ())
+        return result
+
+    def updated(self, keywords: Dict[str, List[str]], previous: Dict[str, List[str]],
+                changed_types: Iterable[str]) -> 'KeywordIndex':
+        """Index for keywords, which differ from previous only in changed_types
+
+        Only substrings that a changed type gains or loses are touched; they
+        are recorded in an overlay on top of the shared base index. This
+        index is not modified.
+        """
+        index = KeywordIndex.__new__(KeywordIndex)
+        index._index = self._index
+        index._overlay = dict(self._overlay)
+        index._type_order = dict(self._type_order)
+        index._next_type_order = self._next_type_order
+
+        for emergency_type in changed_types:
+            old_keywords = previous.get(emergency_type, ())
+            new_keywords = keywords.get(emergency_type, ())
+            old_substrings = _substrings(old_keywords)
+            new_substrings = _substrings(new_keywords)
+            if old_keywords:
+                old_substrings.add('')
+            if new_keywords:
+                new_substrings.add('')
+
+            if emergency_type not in keywords:
+                index._type_order.pop(emergency_type, None)
+            elif emergency_type not in index._type_order:
+                index._type_order[emergency_type] = index._next_type_order
+                index._next_type_order += 1
+
+            for substring in old_substrings - new_substrings:
+                index._overlay[substring] = tuple(t for t in index._lookup(substring)
+                                                  if t != emergency_type)
+            for substring in new_substrings - old_substrings:
+                types = list(index._lookup(substring))
+                types.append(emergency_type)
+                types.sort(key=index._type_order.__getitem__)
+                index._overlay[substring] = tuple(types)
+
+        if len(index._overlay) > max(4096, len(self._index) // 4):
+            return KeywordIndex(keywords)
+        return index
+
+    def search(self, keyword: str) -> List[str]:
+        """Emergency types with a keyword containing keyword (case-insensitive)"""
+        return list(self._lookup(keyword.lower()))
@@ -0,0 +1,123 @@
+# metrics.py
+# Lightweight per-stage timing for the Crisis Assistant query pipeline
+
+import json
+import time
+from bisect import bisect_left
+from typing import Dict, Optional
+
+# Pipeline stages timed for every query, in order; first_instruction runs
+# from the start of the query until the first response chunk is output
+STAGES = ('normalize', 'analyze', 'retrieve', 'generate', 'render', 'output', 'first_instruction', 'total')
+
+# Histogram bucket upper bounds: 1 microsecond to about 4 minutes, four per doubling
+_BUCKET_BOUNDS = tuple(1e-6 * 2 ** (i / 4) for i in range(112))
+
+
+class LatencyHistogram:
+    """
+    Fixed-size log-scale histogram of durations in seconds
+    Memory stays constant however many samples are recorded; percentiles
+    are reported as the upper bound of the bucket they fall in (within 19%)
+    """
+
+    def __init__(self):
+        self.counts = [0] * (len(_BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def record(self, seconds: float):
+        self.counts[bisect_left(_BUCKET_BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if self.max is None or seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        """Approximate duration below which the given fraction of samples fall"""
+        if not self.count:
+            return None
+        rank = max(1, int(round(fraction * self.count)))
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                bound = _BUCKET_BOUNDS[bucket] if bucket < len(_BUCKET_BOUNDS) else self.max
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self) -> Dict:
+        """Summary in milliseconds"""
+        if not self.count:
+            return {'count': 0}
+        return {
+            'count': self.count,
+            'mean_ms': self.total / self.count * 1000,
+            'min_ms': self.min * 1000,
+            'p50_ms': self.percentile(0.50) * 1000,
+            'p95_ms': self.percentile(0.95) * 1000,
+            'p99_ms': self.percentile(0.99) * 1000,
+            'max_ms': self.max * 1000,
+        }
+
+
+class StageMetrics:
+    """
+    Monotonic-clock stage timings recorded into one histogram per stage
+    Callers thread a time mark through the stages:
+
+        mark = metrics.start()
+        ...normalize...
+        mark = metrics.lap('normalize', mark)
+
+    When disabled, start() returns None and lap() returns at once, so the
+    instrumentation costs two cheap calls per stage
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.histograms: Dict[str, LatencyHistogram] = {stage: LatencyHistogram() for stage in STAGES}
+
+    def start(self) -> Optional[float]:
+        """Time mark for the beginning of a stage, or None when disabled"""
+        return time.perf_counter() if self.enabled else None
+
+    def lap(self, stage: str, mark: Optional[float],
+            timings: Optional[Dict[str, float]] = None) -> Optional[float]:
+        """Record the time since mark under stage and return a new mark
+
+        timings, if given, is one query's own record of its stages, kept
+        apart from queries answered meanwhile.
+        """
+        if mark is None:
+            return None
+        now = time.perf_counter()
+        if timings is not None:
+            timings[stage] = now - mark
+        self.histograms[stage].record(now - mark)
+        return now
+
+    def record(self, stage: str, seconds: float, timings: Optional[Dict[str, float]] = None):
+        """Record a duration measured by the caller, e.g. summed over chunks"""
+        if self.enabled:
+            if timings is not None:
+                timings[stage] = seconds
+            self.histograms[stage].record(seconds)
+
+    def reset(self):
+        """Forget every recorded sample"""
+        self.histograms = {stage: LatencyHistogram() for stage in STAGES}
+
+    def snapshot(self) -> Dict:
+        """Machine-readable summary of every stage"""
+        return {
+            'enabled': self.enabled,
+            'stages': {stage: histogram.to_dict() for stage, histogram in self.histograms.items()},
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), indent=2)
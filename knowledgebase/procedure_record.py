@@ -0,0 +1,133 @@
+# procedure_record.py
+# Compact, immutable procedure records for the emergency knowledge base
+
+import sys
+from collections.abc import Mapping
+from enum import Enum
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+# Fields of every procedure, in the order of the built-in tables
+FIELDS = ('title', 'category', 'source', 'procedure', 'critical_warnings',
+          'supplies_needed', 'when_to_seek_help', 'urgency', 'time_critical')
+_FIELD_SET = frozenset(FIELDS)
+_LIST_FIELDS = ('procedure', 'critical_warnings', 'supplies_needed', 'when_to_seek_help')
+
+
+class Urgency(str, Enum):
+    """Urgency level of a procedure; compares, prints and serializes as its name"""
+    CRITICAL = 'CRITICAL'
+    HIGH = 'HIGH'
+    MODERATE = 'MODERATE'
+
+    def __str__(self) -> str:
+        return self.value
+
+    def __format__(self, format_spec: str) -> str:
+        return format(self.value, format_spec)
+
+
+def parse_urgency(value):
+    """Urgency member for a known level; other values are kept as given,
+    so a data file with its own level (e.g. "LOW") still loads"""
+    try:
+        return Urgency(value)
+    except ValueError:
+        return sys.intern(value) if type(value) is str else value
+
+
+def is_critical(procedure: Mapping) -> bool:
+    """Whether a procedure is in the critical tier: CRITICAL urgency or time-critical"""
+    return procedure.get('urgency') == Urgency.CRITICAL or bool(procedure.get('time_critical'))
+
+
+def intern_strings(values: Iterable[str]) -> Tuple[str, ...]:
+    """Tuple of the values with every string interned"""
+    return tuple(sys.intern(v) if type(v) is str else v for v in values)
+
+
+def intern_keywords(keywords: Dict[str, List[str]]) -> Dict[str, Tuple[str, ...]]:
+    """Keyword table with tuples of interned strings, so keywords repeated
+    across emergency types are stored once"""
+    return {sys.intern(t): intern_strings(type_keywords) for t, type_keywords in keywords.items()}
+
+
+class Procedure(Mapping):
+    """
+    One emergency procedure, stored in fixed slots with tuple fields and
+    interned strings instead of a dict of lists
+    Reads like the old dict (procedure['title'], .get(), iteration, dict())
+    and cannot be modified; fields outside FIELDS are kept in extra
+    """
+
+    __slots__ = FIELDS + ('extra',)
+
+    def __init__(self, title: str = '', category: str = '', source: str = '',
+                 procedure: Iterable[str] = (), critical_warnings: Iterable[str] = (),
+                 supplies_needed: Iterable[str] = (), when_to_seek_help: Iterable[str] = (),
+                 urgency: str = 'MODERATE', time_critical: bool = False, extra: Dict = None):
+        set_field = object.__setattr__
+        set_field(self, 'title', sys.intern(title))
+        set_field(self, 'category', sys.intern(category))
+        set_field(self, 'source', sys.intern(source))
+        set_field(self, 'procedure', intern_strings(procedure))
+        set_field(self, 'critical_warnings', intern_strings(critical_warnings))
+        set_field(self, 'supplies_needed', intern_strings(supplies_needed))
+        set_field(self, 'when_to_seek_help', intern_strings(when_to_seek_help))
+        set_field(self, 'urgency', parse_urgency(urgency))
+        set_field(self, 'time_critical', bool(time_critical))
+        set_field(self, 'extra', extra or None)
+
+    @classmethod
+    def from_dict(cls, data: Mapping) -> 'Procedure':
+        """Record from a procedure dict (as in the built-in tables or JSON files)"""
+        if isinstance(data, Procedure):
+            return data
+        fields = {field: data[field] for field in FIELDS if field in data}
+        extra = {sys.intern(k): v for k, v in data.items() if k not in _FIELD_SET}
+        return cls(**fields, extra=extra)
+
+    def to_dict(self) -> Dict:
+        """Plain JSON-ready dict, as the procedure was before it became a record"""
+        data = {field: getattr(self, field) for field in FIELDS}
+        for field in _LIST_FIELDS:
+            data[field] = list(data[field])
+        if isinstance(self.urgency, Urgency):
+            data['urgency'] = self.urgency.value
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    def __getitem__(self, key: str):
+        if key in _FIELD_SET:
+            return getattr(self, key)
+        if self.extra and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        yield from FIELDS
+        if self.extra:
+            yield from self.extra
+
+    def __len__(self) -> int:
+        return len(FIELDS) + (len(self.extra) if self.extra else 0)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __eq__(self, other):
+        # Compare list fields by value, so a record equals its source dict
+        if isinstance(other, Procedure):
+            other = other.to_dict()
+        elif not isinstance(other, Mapping):
+            return NotImplemented
+        return self.to_dict() == dict(other)
+
+    def __reduce__(self):
+        return (Procedure.from_dict, (self.to_dict(),))
+
+    def __repr__(self) -> str:
+        return f"Procedure(title={self.title!r}, urgency={self.urgency})"
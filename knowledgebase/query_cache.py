@@ -0,0 +1,68 @@
+# query_cache.py
+# Bounded LRU cache of query analysis results for the Crisis Assistant
+
+import re
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+# Punctuation, plus apostrophes that are not inside a word ("can't" keeps its own)
+_FOLD_PATTERN = re.compile(r"[^\w\s']+|(?<!\w)'|'(?!\w)")
+
+
+def normalize_query(query: str) -> str:
+    """Fold case, punctuation and whitespace so near-identical queries share a key"""
+    return ' '.join(_FOLD_PATTERN.sub(' ', query.lower()).split())
+
+
+class QueryCache:
+    """
+    Least-recently-used cache keyed on normalized queries
+    Entries are tagged with the knowledge-base generation they were computed
+    against; the whole cache is dropped when the knowledge base changes
+    """
+
+    def __init__(self, max_size: int = 256):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.generation = None
+        self._entries: OrderedDict = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def validate(self, generation: int):
+        """Drop every entry if the knowledge base has changed since they were stored"""
+        if generation != self.generation:
+            self._entries.clear()
+            self.generation = generation
+
+    def get(self, key: Hashable) -> Optional[object]:
+        """Return the cached value for key, or None, updating hit/miss counters"""
+        value = self._entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: Hashable, value: object):
+        """Store a value, evicting the least recently used entry when full"""
+        if self.max_size <= 0:
+            return
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """Remove every entry and reset the counters"""
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def hit_rate(self) -> float:
+        """Fraction of lookups answered from the cache"""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
@@ -1,157 +1,692 @@
 # crisis_assistant_fixed.py
 # Quick fix for the display issue
 
+import time
+_SCRIPT_START = time.perf_counter()
+
 import os
 import sys
+import argparse
+from contextlib import nullcontext
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, Iterator, List, Optional
 import json
 
-try:
-    from rich.console import Console
-    from rich.panel import Panel
-    from rich.text import Text
-    from rich.prompt import Prompt
-    from rich.table import Table
-    from colorama import init, Fore, Back, Style
-    init()
-    RICH_AVAILABLE = True
-except ImportError:
-    RICH_AVAILABLE = False
-    print("⚠️  Rich not installed. Using basic formatting.")
-
-from emergency_database import emergency_db
+# Rich and colorama are imported on first use, not at startup; all output
+# currently goes through the *_basic functions. None means not checked yet.
+RICH_AVAILABLE = None
+
+def rich_available() -> bool:
+    """Import the rich UI libraries on first call and report whether they exist"""
+    global RICH_AVAILABLE
+    if RICH_AVAILABLE is None:
+        try:
+            import rich.console
+            import colorama
+            colorama.init()
+            RICH_AVAILABLE = True
+        except ImportError:
+            RICH_AVAILABLE = False
+            print("⚠️  Rich not installed. Using basic formatting.", file=sys.stderr)
+    return RICH_AVAILABLE
+
+from emergency_database import (EmergencyDatabase, default_database_options,
+                                default_index_cache_dir, get_emergency_db)
+from metrics import StageMetrics
+from query_cache import QueryCache, normalize_query
+
+_IMPORTS_DONE = time.perf_counter()
+
+# Retrieval backends for query analysis:
+#   keyword - hand-curated keyword lists only
+#   bm25    - BM25 ranking over the full procedure text
+#   hybrid  - keyword lists, falling back to BM25 when no keyword matches
+#   dense   - nearest procedure vectors from the offline vector index
+RETRIEVAL_MODES = ('keyword', 'bm25', 'hybrid', 'dense')
+
+# Below this confidence the general guidance is shown instead of a procedure
+MIN_CONFIDENCE = 0.05  # Lowered to 5%
+
+# Cosine similarity hashed trigrams give unrelated text ("the weather is
+# nice today" reaches 0.13 against burns). Dense similarities are rescaled
+# from here to 1.0, which keeps off-topic queries below MIN_CONFIDENCE
+DENSE_BASELINE_SIMILARITY = 0.125
+
+# Emergency types kept per analysis, and what a type other than the best
+# one needs for its procedure to be shown as well (e.g. shock following
+# heavy bleeding): a confidence above any single query word's hits (at most
+# 0.10 on the built-in procedures, "burned"), and this share of the best
+# match's confidence
+TOP_K = 3
+SECONDARY_CONFIDENCE = 0.12
+SECONDARY_SHARE = 0.5
+
+# Confidence at which a critical-tier match (CRITICAL or time-critical
+# procedure) is answered before scoring the rest of the knowledge base; it
+# must also be certain to outrank every other type (see _rank_query_uncached)
+DECISIVE_CONFIDENCE = 0.06
+
+GENERAL_HELP_TEXT = """
+🚨 GENERAL EMERGENCY GUIDANCE
+==================================================
+If you're unsure about the emergency type, please be more specific:
+
+📞 IMMEDIATE ACTIONS:
+   1. Ensure scene safety first
+   2. Check victim responsiveness
+   3. Call for emergency services if possible
+   4. Provide care within your training level
+
+🔍 BE MORE SPECIFIC - Try asking about:
+   • 'Someone is bleeding heavily'
+   • 'Person not breathing, need CPR steps'
+   • 'Got burned by hot water'
+   • 'Child choking on food'
+   • 'Think my arm is broken'
+   • 'Person in shock, pale and weak'
+
+💡 Stay calm and provide care within your abilities.
+==================================================
+"""
 
 class OfflineCrisisAssistant:
-    def __init__(self):
-        self.db = emergency_db
-        self.console = Console() if RICH_AVAILABLE else None
-        self.session_log = []
+    def __init__(self, retrieval: str = 'keyword', cache_size: int = 256, metrics: bool = True,
+                 session_log: Optional[str] = None, data_dir: Optional[str] = None,
+                 watch: bool = False, secondary_confidence: Optional[float] = SECONDARY_CONFIDENCE,
+                 generator: Optional[str] = None, generation_timeout: Optional[float] = None,
+                 critical_fast_path: bool = True):
+        if retrieval not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode: {retrieval}")
+        # Procedures from an editable data directory, or the shared database
+        self.db = (EmergencyDatabase(data_dir=data_dir, index_cache_dir=default_index_cache_dir())
+                   if data_dir else get_emergency_db())
+        if watch:
+            self.db.watch()
+        self._console = None
+        # Audit log of answered queries (JSONL file), or None when not logging
+        self.session_log = None
+        self.session_id = f"{os.getpid()}-{int(time.time())}"
+        if session_log:
+            from session_log import SessionLogger
+            self.session_log = SessionLogger(session_log)
+        self.retrieval = retrieval
+        # Minimum confidence for showing procedures after the best match; None shows none
+        self.secondary_confidence = secondary_confidence
+        # Keyword analysis checks the critical tier first and stops there on a decisive match
+        self.critical_fast_path = critical_fast_path
+        # Ranked results for recent normalized queries; a size of 0 disables caching
+        self.query_cache = QueryCache(cache_size) if cache_size > 0 else None
+        # Static response text per procedure, rendered on first use
+        self._response_templates = {}
+        self._templates_generation = None
+        # Per-stage timings of answered queries
+        self.metrics = StageMetrics(enabled=metrics)
+        # Generated answers on top of the retrieved procedure, or None to
+        # answer with the pre-rendered procedure text
+        self.generator = None
+        if generator:
+            from generation import GENERATION_BACKENDS, GENERATION_TIMEOUT, ResponseGenerator
+            if generator not in GENERATION_BACKENDS:
+                raise ValueError(f"Unknown generation backend: {generator}")
+            self.generator = ResponseGenerator(
+                GENERATION_BACKENDS[generator](),
+                GENERATION_TIMEOUT if generation_timeout is None else generation_timeout)
+        if retrieval != 'keyword':
+            try:
+                if retrieval == 'dense':
+                    self.db.get_vector_index()
+                else:
+                    self.db.get_text_index()
+            except ImportError:
+                print("⚠️  NumPy not installed. Using keyword matching.")
+                self.retrieval = 'keyword'
+    
+    @property
+    def console(self):
+        """Rich console, created on first use; None if rich is not installed"""
+        if self._console is None and rich_available():
+            from rich.console import Console
+            self._console = Console()
+        return self._console
+        
+    def analyze_query(self, query: str, context=None) -> tuple:
+        """Analyze user query to determine emergency type and confidence
+        
+        With a ConversationContext the query is the next turn of that
+        conversation: it is added to the context and analyzed with it.
+        """
+        if context is None:
+            return self._analyze_prepared(self._prepare_query(query))
+        ranked = self._rank_in_context(self._prepare_query(query), context)
+        return ranked[0] if ranked else ('unknown', 0.0)
+    
+    def rank_query(self, query: str, context=None) -> List[tuple]:
+        """Up to TOP_K (emergency_type, confidence) pairs for the query, best first"""
+        snapshot = self.db.snapshot()
+        prepared = self._prepare_query(query)
+        if context is None:
+            ranked = self._rank_prepared(prepared, snapshot)
+        else:
+            ranked = self._rank_in_context(prepared, context, snapshot)
+        if ranked and self._answered_by_critical_tier(ranked[0], snapshot):
+            ranked = self._after_critical(ranked[0], ranked[1:], prepared.lower(), snapshot)
+        return list(ranked)
+    
+    def _prepare_query(self, query: str) -> str:
+        """Normalize the query, so near-identical queries get the same answer
+        and share a cache entry; done with or without the cache, so caching
+        never changes a result"""
+        return normalize_query(query)
+    
+    def _analyze_prepared(self, query: str, snapshot=None) -> tuple:
+        """Best (emergency_type, confidence) for a prepared query"""
+        ranked = self._rank_prepared(query, snapshot)
+        return ranked[0] if ranked else ('unknown', 0.0)
+    
+    def _rank_prepared(self, query: str, snapshot=None) -> tuple:
+        """Rank a prepared query, answering from the cache when possible"""
+        # One knowledge-base snapshot for the whole query, even if a reload
+        # swaps in a new one meanwhile
+        snapshot = snapshot or self.db.snapshot()
+        if self.query_cache is None:
+            return self._rank_query_uncached(query, snapshot)
+        
+        # The analysis runs on the normalized text so every entry depends
+        # only on its key
+        self.query_cache.validate(snapshot.generation)
+        result = self.query_cache.get(query)
+        if result is None:
+            result = self._rank_query_uncached(query, snapshot)
+            self.query_cache.put(query, result)
+        return result
+    
+    def _rank_in_context(self, query: str, context, snapshot=None) -> tuple:
+        """Rank a prepared query as the next turn of a conversation
+        
+        Only this query is analyzed (or found in the cache); earlier turns
+        count through the context's running scores.
+        """
+        snapshot = snapshot or self.db.snapshot()
+        ranked = context.add_turn(query, self._rank_prepared(query, snapshot))
+        # Types from earlier turns may have been removed by a reload since
+        procedures = snapshot.procedures
+        return tuple(r for r in ranked if r[0] in procedures)[:TOP_K]
+    
+    def _rank_query_uncached(self, query: str, snapshot) -> tuple:
+        """Top TOP_K (emergency_type, confidence) pairs from the selected backend"""
+        if self.retrieval == 'bm25':
+            return self.rank_query_text(query, snapshot)
+        if self.retrieval == 'dense':
+            return self.rank_query_dense(query, snapshot)
         
-    def analyze_query(self, query: str) -> tuple:
-        """Analyze user query to determine emergency type and confidence"""
         query_lower = query.lower()
-        keywords_db = self.db.get_keywords()
-        
-        # Calculate weighted scores for each emergency type
-        scores = {}
-        for emergency_type, keywords in keywords_db.items():
-            score = 0
-            for keyword in keywords:
-                if keyword in query_lower:
-                    # Give higher weight to exact matches
-                    if keyword == query_lower.strip():
-                        score += 3
-                    # Medium weight for word boundaries
-                    elif f" {keyword} " in f" {query_lower} ":
-                        score += 2
-                    # Lower weight for partial matches
-                    else:
-                        score += 1
+        # Life-threatening procedures first: their small matcher costs the
+        # same however large the rest of the knowledge base grows. Its best
+        # match is answered at once only if the full matcher's hits show that
+        # no other type can outrank it; the other types are scored later,
+        # for shown secondaries once the first chunk is out (see
+        # _secondary_templates)
+        matcher = snapshot.get_keyword_matcher()
+        if self.critical_fast_path:
+            ranked = tuple(snapshot.get_critical_matcher().rank(query_lower, TOP_K))
+            if ranked and ranked[0][1] >= DECISIVE_CONFIDENCE:
+                confidence = matcher.leading_confidence(query_lower, ranked[0][0])
+                if confidence is not None:
+                    return ((ranked[0][0], confidence),) + ranked[1:]
+        
+        # Scores for each emergency type, found in one pass over the query by
+        # the compiled keyword matcher and normalized by per-type maximums
+        # computed when the knowledge base was loaded
+        ranked = matcher.rank(query_lower, TOP_K)
+        
+        if not ranked and self.retrieval == 'hybrid':
+            return self.rank_query_text(query, snapshot)
+        return tuple(ranked)
+    
+    def _answered_by_critical_tier(self, best: tuple, snapshot) -> bool:
+        """Whether best may have been ranked by the critical tier alone"""
+        return (self.critical_fast_path and self.retrieval in ('keyword', 'hybrid')
+                and best[1] >= DECISIVE_CONFIDENCE and best[0] in snapshot.get_critical_types())
+    
+    @staticmethod
+    def _after_critical(best: tuple, others: tuple, query_lower: str, snapshot) -> tuple:
+        """best, then the rest of the full keyword ranking, then others; TOP_K in all"""
+        listed = {best[0]}
+        merged = []
+        for emergency_type, confidence in (tuple(snapshot.get_keyword_matcher().rank(
+                query_lower, TOP_K)) + tuple(others)):
+            if emergency_type not in listed:
+                listed.add(emergency_type)
+                merged.append((emergency_type, confidence))
+        return (best,) + tuple(merged[:TOP_K - 1])
+    
+    def rank_query_text(self, query: str, snapshot=None) -> tuple:
+        """Rank emergency types by BM25 relevance of the full procedure text"""
+        text_index = (snapshot or self.db.snapshot()).get_text_index()
+        ranked = text_index.search(query, top_k=TOP_K)
+        if not ranked:
+            return ()
+        
+        # Normalize against the score a perfect match on every query term reaches
+        max_score = text_index.max_score(query)
+        return tuple((emergency_type, min(raw_score / max_score, 1.0))
+                     for emergency_type, raw_score in ranked)
+    
+    def rank_query_dense(self, query: str, snapshot=None) -> tuple:
+        """Rank emergency types by nearest-neighbour search over procedure vectors"""
+        ranked = (snapshot or self.db.snapshot()).get_vector_index().search(query, top_k=TOP_K)
+        return self._dense_confidences(ranked)
+    
+    @staticmethod
+    def _dense_confidences(ranked: List[tuple]) -> tuple:
+        """(emergency_type, confidence) from (emergency_type, similarity) pairs,
+        dropping those no closer than unrelated text"""
+        scale = 1.0 - DENSE_BASELINE_SIMILARITY
+        return tuple((emergency_type, min((similarity - DENSE_BASELINE_SIMILARITY) / scale, 1.0))
+                     for emergency_type, similarity in ranked
+                     if similarity > DENSE_BASELINE_SIMILARITY)
+    
+    def analyze_query_text(self, query: str, snapshot=None) -> tuple:
+        """Analyze user query by BM25 ranking over the full procedure text"""
+        ranked = self.rank_query_text(query, snapshot)
+        return ranked[0] if ranked else ('unknown', 0.0)
+    
+    def analyze_query_dense(self, query: str, snapshot=None) -> tuple:
+        """Analyze user query by nearest-neighbour search over procedure vectors"""
+        ranked = self.rank_query_dense(query, snapshot)
+        return ranked[0] if ranked else ('unknown', 0.0)
+    
+    def analyze_queries(self, queries: Iterable[str]) -> List[Dict]:
+        """Analyze many queries, returning one result dict per query in input order"""
+        queries = list(queries)
+        snapshot = self.db.snapshot()
+        if self.retrieval == 'dense':
+            # Embed and score the whole batch with one matrix product
+            ranked = snapshot.get_vector_index().search_batch(
+                [self._prepare_query(query) for query in queries], top_k=1)
+            analyses = [(self._dense_confidences(r) or (('unknown', 0.0),))[0] for r in ranked]
+        else:
+            analyses = [self._analyze_prepared(self._prepare_query(query), snapshot)
+                        for query in queries]
+        
+        return [{'query': query, 'emergency_type': emergency_type, 'confidence': confidence}
+                for query, (emergency_type, confidence) in zip(queries, analyses)]
+    
+    def _response_template(self, emergency_type: str, snapshot=None) -> Optional[tuple]:
+        """Static parts of a procedure's response, rendered once
+        
+        Returns (priority, head, sections). For time-critical procedures
+        priority holds the first action step and the critical warnings, to
+        be sent before everything else; otherwise it is None.
+        """
+        snapshot = snapshot or self.db.snapshot()
+        if self._templates_generation != snapshot.generation:
+            self._response_templates.clear()
+            self._templates_generation = snapshot.generation
+        
+        template = self._response_templates.get(emergency_type)
+        if template is None:
+            procedure_data = snapshot.get_procedure(emergency_type)
+            if not procedure_data:
+                return None
             
-            if score > 0:
-                scores[emergency_type] = score
+            time_critical = procedure_data['time_critical'] and procedure_data['procedure']
+            priority = None
+            if time_critical:
+                lines = [
+                    "\n" + "="*80,
+                    f"🚨 TIME-CRITICAL: {procedure_data['title'].upper()}",
+                    "="*80,
+                    f"▶️  DO THIS FIRST: {procedure_data['procedure'][0]}",
+                    "",
+                    "⚠️  CRITICAL WARNINGS:",
+                ]
+                lines.extend(f"   {warning}" for warning in procedure_data['critical_warnings'])
+                priority = "\n".join(lines) + "\n"
+            
+            head = [
+                "\n" + "="*80,
+                f"🚨 EMERGENCY RESPONSE: {procedure_data['title'].upper()}",
+                "="*80,
+                f"⚠️  URGENCY LEVEL: {procedure_data['urgency']}",
+            ]
+            sections = [[f"📚 SOURCE: {procedure_data['source']}", ""]]
+            sections.append(["🔧 REQUIRED SUPPLIES:"] +
+                            [f"   • {item}" for item in procedure_data['supplies_needed']] + [""])
+            sections.append(["📋 STEP-BY-STEP PROCEDURE:"] +
+                            [f"   {step}" for step in procedure_data['procedure']] + [""])
+            if not time_critical:
+                # Time-critical procedures already led with their warnings
+                sections.append(["⚠️  CRITICAL WARNINGS:"] +
+                                [f"   {warning}" for warning in procedure_data['critical_warnings']] + [""])
+            sections.append(["🏥 SEEK IMMEDIATE MEDICAL HELP IF:"] +
+                            [f"   • {condition}" for condition in procedure_data['when_to_seek_help']] + [""])
+            sections.append(["💡 DISCLAIMER: This device provides emergency guidance only.",
+                             "   Seek professional medical help as soon as possible.",
+                             "="*80])
+            
+            template = (priority, "\n".join(head) + "\n",
+                        tuple("\n".join(lines) + "\n" for lines in sections))
+            self._response_templates[emergency_type] = template
+        return template
+    
+    def render_response(self, emergency_type: str, query: str, confidence: float) -> Optional[str]:
+        """Full response text for a procedure, or None if there is no such procedure"""
+        template = self._response_template(emergency_type)
+        if template is None:
+            return None
+        
+        return self._fill_template(template, query, confidence)
+    
+    @classmethod
+    def _fill_template(cls, template: tuple, query: str, confidence: float) -> str:
+        """Add the dynamic fields to a pre-rendered response"""
+        return "".join(cls._template_chunks(template, query, confidence))
+    
+    @staticmethod
+    def _template_chunks(template: tuple, query: str, confidence: float) -> Iterator[str]:
+        """Response text in priority order, one section at a time"""
+        priority, head, sections = template
+        if priority is not None:
+            yield priority
+        # Only the query, time and confidence change between responses
+        yield (f"{head}📍 QUERY: {query}\n"
+               f"⏱️  TIME: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
+               f"🎯 CONFIDENCE: {confidence:.1%}\n")
+        yield from sections
+    
+    def stream_answer(self, query: str, context=None,
+                      timings: Optional[Dict[str, float]] = None) -> tuple:
+        """Classify a query and return (emergency_type, confidence, chunks)
+        
+        chunks yields the response text in priority order, rendering each
+        piece only when asked for, so a terminal, socket or speech consumer
+        can start on the first action step at once. Other procedures that
+        reach the secondary confidence follow the best match. Low-confidence
+        queries get the general guidance text as a single chunk.
+        
+        With a generator, generation of the answer starts here and the
+        chunks wait for it only after the time-critical first step and the
+        response header, falling back to the pre-rendered procedure text at
+        the generation timeout. With a context the query is analyzed as the
+        next turn of that conversation, as in analyze_query(). Stage timings
+        are also written to timings, if given, as the chunks are consumed.
+        """
+        metrics = self.metrics
+        started = metrics.start()
+        mark = started
+        snapshot = self.db.snapshot()
+        
+        prepared = self._prepare_query(query)
+        mark = metrics.lap('normalize', mark, timings)
+        
+        if context is None:
+            ranked = self._rank_prepared(prepared, snapshot)
+        else:
+            ranked = self._rank_in_context(prepared, context, snapshot)
+        emergency_type, confidence = ranked[0] if ranked else ('unknown', 0.0)
+        mark = metrics.lap('analyze', mark, timings)
+        
+        template = None
+        secondary = ()
+        pending = None
+        if emergency_type != 'unknown' and confidence >= MIN_CONFIDENCE:
+            template = self._response_template(emergency_type, snapshot)
+            if self.generator is not None and template is not None:
+                pending = (self.generator.submit(snapshot.generation, emergency_type,
+                                                 snapshot.get_procedure(emergency_type), query),
+                           time.monotonic() + self.generator.timeout)
+            if self.secondary_confidence is not None:
+                secondary = self._secondary_templates(prepared, ranked, snapshot)
+            metrics.lap('retrieve', mark, timings)
         
-        if not scores:
-            return 'unknown', 0.0
+        return emergency_type, confidence, self._timed_chunks(template, query, confidence, started,
+                                                              secondary, pending, timings)
+    
+    def _secondary_templates(self, query: str, ranked: tuple, snapshot) -> Iterator[tuple]:
+        """(template, confidence) of each other procedure shown after the best match
+        
+        Runs only once the best match has been sent: a best match from the
+        critical tier alone has the rest of the knowledge base scored here.
+        """
+        others = ranked[1:]
+        if self._answered_by_critical_tier(ranked[0], snapshot):
+            others = self._after_critical(ranked[0], others, query.lower(), snapshot)[1:]
+        threshold = max(self.secondary_confidence, MIN_CONFIDENCE,
+                        ranked[0][1] * SECONDARY_SHARE)
+        for other_type, other_confidence in others:
+            other_template = (self._response_template(other_type, snapshot)
+                              if other_confidence >= threshold else None)
+            if other_template is not None:
+                yield other_template, other_confidence
+    
+    def _response_chunks(self, template: tuple, query: str, confidence: float,
+                         secondary: Iterable[tuple] = (), pending: Optional[tuple] = None,
+                         timings: Optional[Dict[str, float]] = None) -> Iterator[str]:
+        """Chunks of the best match, then of each (template, confidence) in secondary"""
+        if pending is None:
+            yield from self._template_chunks(template, query, confidence)
+        else:
+            yield from self._generated_chunks(template, query, confidence, *pending, timings)
+        for other_template, other_confidence in secondary:
+            yield (f"\n➕ ALSO CONSIDER ({other_confidence:.1%} confidence) - "
+                   "the query may describe more than one emergency:\n")
+            yield from self._template_chunks(other_template, query, other_confidence)
+    
+    def _generated_chunks(self, template: tuple, query: str, confidence: float,
+                          future, deadline: float,
+                          timings: Optional[Dict[str, float]] = None) -> Iterator[str]:
+        """Generated answer in place of the step-by-step procedure, or the
+        pre-rendered procedure if generation misses its deadline"""
+        priority, head, sections = template
+        # Sections are source, supplies, steps, then warnings, seek help and
+        # the disclaimer; only the steps are replaced by the generated text
+        before, after = sections[:2], sections[3:]
+        chunks = self._template_chunks((priority, head, before), query, confidence)
+        # The time-critical first step, header and supplies never wait for generation
+        yield from chunks
         
-        # Get best match and calculate confidence
-        best_match = max(scores.items(), key=lambda x: x[1])
-        emergency_type, raw_score = best_match
+        mark = self.metrics.start()
+        text = self.generator.result(future, deadline)
+        if mark is not None:
+            self.metrics.record('generate', time.perf_counter() - mark, timings)
+        if text is None:
+            yield sections[2]
+        else:
+            yield f"🤖 GUIDANCE:\n{text}\n\n"
+        yield from after
+    
+    def _timed_chunks(self, template: Optional[tuple], query: str, confidence: float,
+                      started: Optional[float], secondary: Iterable[tuple] = (),
+                      pending: Optional[tuple] = None,
+                      timings: Optional[Dict[str, float]] = None) -> Iterator[str]:
+        """Yield response chunks, timing the first instruction and the render
+        
+        Time to first instruction runs from the start of the query until the
+        consumer comes back for the second chunk, i.e. has output the first.
+        Render time counts only the time spent producing chunks, including
+        any wait for generated text (also recorded on its own as 'generate').
+        """
+        metrics = self.metrics
+        if template is None:
+            chunks = iter((GENERAL_HELP_TEXT,))
+        else:
+            chunks = self._response_chunks(template, query, confidence, secondary, pending,
+                                           timings)
         
-        # Normalize confidence score (0-1)
-        max_possible_score = len(keywords_db[emergency_type]) * 3
-        confidence = min(raw_score / max_possible_score, 1.0)
+        render_seconds = 0.0
+        first = True
+        while True:
+            mark = metrics.start()
+            chunk = next(chunks, None)
+            if mark is not None:
+                render_seconds += time.perf_counter() - mark
+            if chunk is None:
+                break
+            yield chunk
+            if first:
+                metrics.lap('first_instruction', started, timings)
+                first = False
+        if template is not None:
+            metrics.record('render', render_seconds, timings)
+    
+    def answer_query(self, query: str, context=None,
+                     timings: Optional[Dict[str, float]] = None) -> tuple:
+        """Classify a query and render its response, timing each stage
         
-        return emergency_type, confidence
+        Returns (emergency_type, confidence, response_text); low-confidence
+        queries get the general guidance text.
+        """
+        emergency_type, confidence, chunks = self.stream_answer(query, context, timings)
+        return emergency_type, confidence, "".join(chunks)
     
     def format_response_basic(self, emergency_type: str, query: str, confidence: float):
         """Basic formatting that always works"""
-        procedure_data = self.db.get_procedure(emergency_type)
-        if not procedure_data:
+        template = self._response_template(emergency_type)
+        if template is None:
             self.show_general_help_basic()
             return
         
-        print("\n" + "="*80)
-        print(f"🚨 EMERGENCY RESPONSE: {procedure_data['title'].upper()}")
-        print("="*80)
-        print(f"⚠️  URGENCY LEVEL: {procedure_data['urgency']}")
-        print(f"📍 QUERY: {query}")
-        print(f"⏱️  TIME: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        print(f"🎯 CONFIDENCE: {confidence:.1%}")
-        print(f"📚 SOURCE: {procedure_data['source']}")
-        print()
-        
-        print("🔧 REQUIRED SUPPLIES:")
-        for item in procedure_data['supplies_needed']:
-            print(f"   • {item}")
-        print()
-        
-        print("📋 STEP-BY-STEP PROCEDURE:")
-        for step in procedure_data['procedure']:
-            print(f"   {step}")
-        print()
-        
-        print("⚠️  CRITICAL WARNINGS:")
-        for warning in procedure_data['critical_warnings']:
-            print(f"   {warning}")
-        print()
-        
-        print("🏥 SEEK IMMEDIATE MEDICAL HELP IF:")
-        for condition in procedure_data['when_to_seek_help']:
-            print(f"   • {condition}")
-        print()
-        
-        print("💡 DISCLAIMER: This device provides emergency guidance only.")
-        print("   Seek professional medical help as soon as possible.")
-        print("="*80)
+        # Highest-priority text first, each section written as soon as it is ready
+        for chunk in self._template_chunks(template, query, confidence):
+            sys.stdout.write(chunk)
+            sys.stdout.flush()
     
     def show_general_help_basic(self):
         """Basic general help"""
-        print("\n🚨 GENERAL EMERGENCY GUIDANCE")
-        print("="*50)
-        print("If you're unsure about the emergency type, please be more specific:")
-        print("\n📞 IMMEDIATE ACTIONS:")
-        print("   1. Ensure scene safety first")
-        print("   2. Check victim responsiveness")
-        print("   3. Call for emergency services if possible")
-        print("   4. Provide care within your training level")
-        print("\n🔍 BE MORE SPECIFIC - Try asking about:")
-        print("   • 'Someone is bleeding heavily'")
-        print("   • 'Person not breathing, need CPR steps'")
-        print("   • 'Got burned by hot water'")
-        print("   • 'Child choking on food'")
-        print("   • 'Think my arm is broken'")
-        print("   • 'Person in shock, pale and weak'")
-        print("\n💡 Stay calm and provide care within your abilities.")
-        print("="*50)
-    
-    def process_emergency_query(self, query: str):
-        """Main function to process emergency queries"""        
-        print(f"\n🔄 Processing query: '{query}'")
-        print("📊 Analyzing emergency type...")
-        
-        # Analyze the query
-        emergency_type, confidence = self.analyze_query(query)
-        
-        print(f"✅ Emergency type identified: {emergency_type} ({confidence:.1%} confidence)")
-        print("📖 Retrieving offline guidance...")
-        print()  # Add space before response
-        
-        # Format and display response
-        if emergency_type == 'unknown' or confidence < 0.05:  # Lowered to 5%
-            self.show_general_help_basic()
-        else:
-            self.format_response_basic(emergency_type, query, confidence)
+        sys.stdout.write(GENERAL_HELP_TEXT)
+    
+    def process_emergency_query(self, query: str, context=None):
+        """Main function to process emergency queries"""
+        metrics = self.metrics
+        started = metrics.start()
+        timings = {}
+        
+        # Analyze the query; the response is rendered while it is written
+        emergency_type, confidence, chunks = self.stream_answer(query, context, timings)
+        
+        # Progress lines and a blank line go out with the first chunk, which
+        # for time-critical procedures is the first action step
+        prefix = (f"\n🔄 Processing query: '{query}'\n"
+                  "📊 Analyzing emergency type...\n"
+                  f"✅ Emergency type identified: {emergency_type} ({confidence:.1%} confidence)\n"
+                  "📖 Retrieving offline guidance...\n"
+                  "\n")
+        output_seconds = 0.0
+        for chunk in chunks:
+            mark = metrics.start()
+            sys.stdout.write(prefix + chunk)
+            sys.stdout.flush()
+            prefix = ""
+            if mark is not None:
+                output_seconds += time.perf_counter() - mark
+        metrics.record('output', output_seconds, timings)
+        metrics.lap('total', started, timings)
+        self.log_query(query, emergency_type, confidence, timings=timings)
+    
+    def log_query(self, query: str, emergency_type: str, confidence: float,
+                  channel: str = 'terminal', client: Optional[int] = None,
+                  timings: Optional[Dict[str, float]] = None):
+        """Record an answered query, with its stage timings (from stream_answer
+        or answer_query; none if not given), in the session log"""
+        if self.session_log is None:
+            return
+        served = emergency_type
+        if emergency_type == 'unknown' or confidence < MIN_CONFIDENCE:
+            served = 'general_guidance'
+        self.session_log.log({
+            'ts': time.time(),
+            'session': self.session_id,
+            'channel': channel,
+            'client': client,
+            'query': query,
+            'emergency_type': emergency_type,
+            'confidence': round(confidence, 4),
+            'procedure': served,
+            'timings_ms': {stage: round(seconds * 1000, 3)
+                           for stage, seconds in (timings or {}).items()},
+        })
+    
+    def close(self):
+        """Stop watching the knowledge base and generation, and flush and close the session log"""
+        self.db.stop_watching()
+        if self.generator is not None:
+            self.generator.close()
+        if self.session_log is not None:
+            self.session_log.close()
+    
+    def reload_knowledge_base(self):
+        """Pick up knowledge-base edits now and report what changed"""
+        if not self.db.data_dir:
+            self.db.reload()
+            print(f"🔄 Knowledge base reloaded (version {self.db.generation})")
+            return
+        
+        if not self.db.check_for_changes() and not self.db.last_update.get('errors'):
+            print("🔄 Knowledge base is up to date")
+            return
+        update = self.db.last_update
+        print(f"🔄 Knowledge base version {self.db.generation}: "
+              f"{len(update.get('updated', []))} updated, {len(update.get('removed', []))} removed "
+              f"in {update.get('seconds', 0) * 1000:.1f} ms")
+        for error in update.get('errors', []):
+            print(f"⚠️  Skipped {error}")
+    
+    def show_metrics(self, as_json: bool = False):
+        """Display per-stage timings of answered queries"""
+        if as_json:
+            print(self.metrics.to_json())
+            return
+        
+        print("\n⏱️  QUERY PIPELINE METRICS")
+        print("="*60)
+        if not self.metrics.enabled:
+            print("Metrics are disabled.")
+        print(f"{'stage':<17} {'count':>6} {'mean':>9} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}")
+        for stage, summary in self.metrics.snapshot()['stages'].items():
+            if not summary['count']:
+                print(f"{stage:<17} {0:>6}")
+                continue
+            print(f"{stage:<17} {summary['count']:>6} " +
+                  " ".join(f"{summary[k]:>7.3f}ms" for k in ('mean_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms')))
+        print("="*60)
     
     def show_system_status(self):
         """Display system status"""
         print("\n🏥 OFFLINE CRISIS ASSISTANT - SYSTEM STATUS")
         print("="*60)
         print("✅ System Mode: OFFLINE OPERATIONAL")
-        print("✅ Knowledge Base: LOADED")
+        if self.db.data_dir:
+            watching = " (WATCHING FOR CHANGES)" if self.db.watching else ""
+            print(f"✅ Knowledge Base: {self.db.data_dir}, VERSION {self.db.generation}{watching}")
+        else:
+            print("✅ Knowledge Base: LOADED")
         print(f"✅ Emergency Procedures: {len(self.db.get_all_procedures())} PROCEDURES READY")
-        print("✅ Response Time: <3 SECONDS")
+        if self.critical_fast_path and self.retrieval in ('keyword', 'hybrid'):
+            print(f"✅ Critical Tier: {len(self.db.get_critical_types())} LIFE-THREATENING PROCEDURES CHECKED FIRST")
+        total = self.metrics.histograms['total']
+        if total.count:
+            print(f"✅ Response Time: p50 {total.percentile(0.50) * 1000:.1f} ms, "
+                  f"p99 {total.percentile(0.99) * 1000:.1f} ms over {total.count} queries")
+        else:
+            print("✅ Response Time: NOT YET MEASURED")
+        if self.query_cache is not None:
+            cache = self.query_cache
+            print(f"✅ Query Cache: {cache.hits} hits / {cache.misses} misses "
+                  f"({cache.hit_rate():.1%} hit rate), {len(cache)}/{cache.max_size} entries")
+        else:
+            print("✅ Query Cache: DISABLED")
+        if self.generator is not None:
+            stats = self.generator.stats()
+            print(f"✅ Generation: {stats['backend']} backend, {stats['requests']} requests "
+                  f"({stats['coalesced']} coalesced, {stats['timeouts']} timed out), prompt prefix "
+                  f"cache {stats['prefix_hits']} hits / {stats['prefix_misses']} misses")
+        else:
+            print("✅ Generation: OFF (PRE-RENDERED PROCEDURES)")
+        if self.session_log is not None:
+            stats = self.session_log.stats()
+            print(f"✅ Session Log: {stats['written']} written, {stats['buffered']} buffered, "
+                  f"{stats['dropped']} dropped -> {stats['path']}")
         print("✅ Network Dependency: NONE (FULLY OFFLINE)")
         print("="*60)
         
@@ -161,9 +696,9 @@ class OfflineCrisisAssistant:
             print(f"• {data['title']} - {data['urgency']} PRIORITY")
         print("="*60)
 
-def demo_mode():
+def demo_mode(**assistant_options):
     """Demo mode for presentation"""
-    assistant = OfflineCrisisAssistant()
+    assistant = OfflineCrisisAssistant(**assistant_options)
     
     demo_queries = [
         "Someone is bleeding heavily from their arm",
@@ -186,14 +721,20 @@ def demo_mode():
         
         if i < len(demo_queries):
             input("\nPress Enter for next demo query...")
+    
+    assistant.close()
 
-def interactive_mode():
+def interactive_mode(**assistant_options):
     """Interactive mode for testing"""
-    assistant = OfflineCrisisAssistant()
+    from conversation_context import ConversationContext
+    assistant = OfflineCrisisAssistant(**assistant_options)
+    # Queries are follow-ups of the ones before, until 'new'
+    context = ConversationContext()
     
     assistant.show_system_status()
     
-    print("\n🔴 INTERACTIVE MODE - Type 'quit' to exit, 'help' for guidance")
+    print("\n🔴 INTERACTIVE MODE - Type 'quit' to exit, 'help' for guidance, 'metrics' for timings")
+    print("   Follow-up queries build on earlier ones; type 'new' for a new emergency")
     print("="*60)
     
     while True:
@@ -209,10 +750,21 @@ def interactive_mode():
             elif query.lower() == 'status':
                 assistant.show_system_status()
                 continue
+            elif query.lower() in ['metrics', 'metrics json']:
+                assistant.show_metrics(as_json=query.lower().endswith('json'))
+                continue
+            elif query.lower() == 'reload':
+                assistant.reload_knowledge_base()
+                continue
+            elif query.lower() == 'new':
+                context.clear()
+                print("🆕 New conversation - earlier queries no longer affect the analysis")
+                continue
             elif query:
-                assistant.process_emergency_query(query)
+                assistant.process_emergency_query(query, context)
             else:
-                print("Please enter an emergency query, 'help', 'status', or 'quit'.")
+                print("Please enter an emergency query, 'help', 'status', 'metrics', "
+                      "'reload', 'new', or 'quit'.")
                 
         except KeyboardInterrupt:
             print("\n👋 Crisis Assistant shutting down. Stay safe!")
@@ -220,9 +772,336 @@ def interactive_mode():
         except Exception as e:
             print(f"❌ Error: {e}")
             print("Please try again with a different query.")
+    
+    assistant.close()
+
+# Assistant used by batch workers. It is created once per worker process;
+# forked workers inherit the parent's, so the compiled knowledge base is
+# shared instead of rebuilt for every task.
+_batch_assistant = None
+_batch_options = None
+
+def _init_batch_worker(assistant_options: Dict):
+    """Pool initializer - create the worker's assistant if not inherited"""
+    global _batch_assistant, _batch_options
+    if _batch_assistant is None or _batch_options != assistant_options:
+        _batch_assistant = OfflineCrisisAssistant(**assistant_options)
+        _batch_options = assistant_options
+
+def _analyze_batch_record(line: str) -> str:
+    """Analyze one JSONL record and return the JSONL result line"""
+    try:
+        record = json.loads(line)
+        if isinstance(record, str):
+            record = {'query': record}
+        record.update(_batch_assistant.analyze_queries([record['query']])[0])
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        record = {'input': line.rstrip('\n'), 'error': f"Invalid record: {e}"}
+    return json.dumps(record, ensure_ascii=False)
+
+def batch_mode(input_path: str, output_path: Optional[str] = None,
+               workers: int = 1, chunksize: int = 64, **assistant_options):
+    """Stream a JSONL file of queries through a worker pool into JSONL results
+    
+    Each input line is a JSON object with a 'query' field, or a JSON string.
+    Output lines keep the input fields and add 'emergency_type' and
+    'confidence', in the same order as the input.
+    """
+    _init_batch_worker(assistant_options)
+    
+    start = time.perf_counter()
+    count = 0
+    with open(input_path, encoding='utf-8') as src, \
+            (open(output_path, 'w', encoding='utf-8') if output_path else nullcontext(sys.stdout)) as dst:
+        records = (line for line in src if line.strip())
+        
+        if workers > 1:
+            import multiprocessing
+            pool = multiprocessing.Pool(workers, initializer=_init_batch_worker,
+                                        initargs=(assistant_options,))
+            results = pool.imap(_analyze_batch_record, records, chunksize)
+        else:
+            pool = None
+            results = map(_analyze_batch_record, records)
+        
+        try:
+            for result in results:
+                dst.write(result + '\n')
+                count += 1
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+    
+    elapsed = time.perf_counter() - start
+    print(f"✅ Batch complete: {count} queries in {elapsed:.2f}s "
+          f"({count / elapsed if elapsed else 0:.0f} queries/sec)", file=sys.stderr)
+
+def answer_query_mode(query: str, **assistant_options):
+    """Answer one query given on the command line and exit"""
+    assistant = OfflineCrisisAssistant(**assistant_options)
+    assistant.process_emergency_query(query)
+    assistant.close()
+
+def _child_importtime(query: str, assistant_options: Dict) -> tuple:
+    """Answer the query in a fresh interpreter under -X importtime
+    
+    Returns the wall-clock time of the whole process in seconds and a list
+    of (cumulative_us, self_us, module) tuples for every import.
+    """
+    import subprocess
+    command = [sys.executable, '-X', 'importtime', os.path.abspath(__file__),
+               '--query', query, '--retrieval', assistant_options.get('retrieval', 'keyword')]
+    if assistant_options.get('data_dir'):
+        command += ['--data-dir', assistant_options['data_dir']]
+    if assistant_options.get('secondary_confidence', SECONDARY_CONFIDENCE) is None:
+        command.append('--no-secondary')
+    start = time.perf_counter()
+    child = subprocess.run(command, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    
+    imports = []
+    for line in child.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        try:
+            imports.append((int(fields[1]), int(fields[0]), fields[2].strip()))
+        except (IndexError, ValueError):
+            continue  # column header line
+    return elapsed, imports
+
+def startup_report(query: str, top: int = 10, **assistant_options):
+    """Report where cold-start time goes, up to the first answer for a query"""
+    import io
+    from contextlib import redirect_stdout
+    
+    # Stages in this process, measured from the first line of the script
+    stage_start = time.perf_counter()
+    assistant = OfflineCrisisAssistant(**assistant_options)
+    assistant_ready = time.perf_counter()
+    emergency_type, confidence = assistant.analyze_query(query)
+    analyzed = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        assistant.process_emergency_query(query)
+    answered = time.perf_counter()
+    
+    process_wall, imports = _child_importtime(query, assistant_options)
+    
+    print("\n⏱️  OFFLINE CRISIS ASSISTANT - STARTUP REPORT")
+    print("="*60)
+    print(f"Query: {query}")
+    print(f"Result: {emergency_type} ({confidence:.1%} confidence)")
+    print("-" * 60)
+    print(f"Module imports:            {(_IMPORTS_DONE - _SCRIPT_START) * 1000:8.1f} ms")
+    print(f"Knowledge base + assistant:{(assistant_ready - stage_start) * 1000:8.1f} ms")
+    print(f"First analysis:            {(analyzed - assistant_ready) * 1000:8.1f} ms")
+    print(f"First full answer:         {(answered - analyzed) * 1000:8.1f} ms")
+    print(f"Time to first answer:      {(answered - _SCRIPT_START) * 1000:8.1f} ms (since script start)")
+    print(f"Fresh process, wall clock: {process_wall * 1000:8.1f} ms (interpreter included)")
+    print("-" * 60)
+    print(f"Slowest imports in a fresh process (-X importtime, top {top}):")
+    print(f"   {'cumulative':>10}  {'self':>8}  module")
+    for cumulative, own, module in sorted(imports, reverse=True)[:top]:
+        print(f"   {cumulative / 1000:8.1f}ms  {own / 1000:6.1f}ms  {module}")
+    print("="*60)
+
+def _file_size_mb(path: str) -> float:
+    try:
+        return os.path.getsize(path) / 1e6
+    except OSError:
+        return 0.0
+
+def rebuild_cache_mode(data_dir: Optional[str] = None, **assistant_options):
+    """Rebuild the index cache from scratch, then time a warm start against it"""
+    from index_cache import cache_path
+    options = default_database_options()
+    if data_dir:
+        options.update(data_dir=data_dir, kb_path=None)
+    cache_dir = options['index_cache_dir']
+    if not cache_dir:
+        print("⚠️  Index cache disabled (CRISIS_INDEX_CACHE is empty). Nothing to rebuild.")
+        return
+    if not (options['data_dir'] or options['kb_path']):
+        print("ℹ️  The built-in procedures are indexed at startup and not cached.")
+        print("   Use --data-dir or a compiled knowledge base (CRISIS_KB_PATH).")
+        return
+    try:
+        import text_index  # imported up front so neither timing includes it
+    except ImportError:
+        text_index = None
+    
+    def boot(**extra) -> tuple:
+        # Ready means every index a first query may touch is in memory
+        start = time.perf_counter()
+        db = EmergencyDatabase(**options, **extra)
+        db.get_critical_matcher()
+        if text_index is not None:
+            db.get_text_index()
+        return db, time.perf_counter() - start
+    
+    db, cold = boot(rebuild_index_cache=True)
+    _db, warm = boot()
+    
+    print("\n🗂️  OFFLINE CRISIS ASSISTANT - INDEX CACHE")
+    print("="*60)
+    print(f"Source: {options['data_dir'] or options['kb_path']} "
+          f"({len(db.get_all_procedures())} procedures)")
+    print(f"Cache:  {cache_dir}")
+    print(f"Content hash: {db.content_hash()[:16]}")
+    print("-" * 60)
+    print(f"Cold build (cache rebuilt): {cold * 1000:8.1f} ms")
+    print(f"Warm start (cache loaded):  {warm * 1000:8.1f} ms "
+          f"({cold / warm if warm else 0:.1f}x faster)")
+    for name in ('keyword_indexes', 'text_index'):
+        path = cache_path(cache_dir, name, db.content_hash())
+        if os.path.exists(path):
+            print(f"   {os.path.basename(path)}: {_file_size_mb(path):.1f} MB")
+    if text_index is None:
+        print("   (NumPy not installed: full-text index not built or cached)")
+    print("="*60)
+
+def _parse_address(address: str) -> tuple:
+    """Split '[HOST:]PORT' into (host, port)"""
+    host, _, port = address.rpartition(':')
+    return host or '127.0.0.1', int(port)
 
-def main():
+def server_mode(address: Optional[str] = None, unix_path: Optional[str] = None,
+                **assistant_options):
+    """Serve many clients over a local TCP or Unix socket until interrupted"""
+    import asyncio
+    from crisis_server import CrisisServer
+    
+    async def run():
+        assistant = OfflineCrisisAssistant(**assistant_options)
+        server = CrisisServer(assistant)
+        if unix_path:
+            await server.start(path=unix_path)
+        else:
+            host, port = _parse_address(address)
+            await server.start(host, port)
+        print(f"🛰️  Crisis Assistant server listening on {server.addresses} - Ctrl+C to stop")
+        await server.serve_forever()
+        assistant.close()
+        print(f"👋 Server stopped after {server.requests_served} requests. Stay safe!")
+    
+    asyncio.run(run())
+
+def loadgen_mode(address: Optional[str] = None, connections: int = 16, requests: int = 500,
+                 depth: int = 8, **assistant_options):
+    """Measure sustained queries/sec and p99 latency against a server
+    
+    With no address, an in-process server on a free local port is used.
+    """
+    import asyncio
+    from crisis_server import CrisisServer, print_load_report, run_load
+    
+    queries = [
+        "Someone is bleeding heavily from their arm",
+        "Person collapsed and not breathing",
+        "Got burned by hot water on my hand",
+        "Child is choking on food",
+        "I think my leg is broken after falling",
+        "Person in shock, pale and weak",
+    ]
+    
+    async def run():
+        server = None
+        if address:
+            host, port = _parse_address(address)
+        else:
+            server = CrisisServer(OfflineCrisisAssistant(**assistant_options),
+                                  max_connections=max(connections, 64))
+            await server.start('127.0.0.1', 0)
+            host, port = server.addresses[0][:2]
+        try:
+            return await run_load(queries, host, port, connections=connections,
+                                  requests=requests, depth=depth)
+        finally:
+            if server is not None:
+                await server.shutdown()
+    
+    print_load_report(asyncio.run(run()))
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parse command-line options"""
+    parser = argparse.ArgumentParser(description="Offline Crisis Assistant")
+    parser.add_argument('--retrieval', choices=RETRIEVAL_MODES, default='keyword',
+                        help="retrieval backend for query analysis (default: keyword)")
+    parser.add_argument('--cache-size', type=int, default=256,
+                        help="query result cache entries, 0 to disable (default: 256)")
+    parser.add_argument('--query', '-q', metavar='TEXT',
+                        help="answer a single query and exit (fast start)")
+    parser.add_argument('--startup-report', action='store_true',
+                        help="measure import, load and time-to-first-answer for --query")
+    parser.add_argument('--no-metrics', action='store_true',
+                        help="disable per-stage timing of queries")
+    parser.add_argument('--session-log', metavar='PATH',
+                        help="append a JSONL audit record for every answered query")
+    parser.add_argument('--batch', metavar='QUERIES.jsonl',
+                        help="analyze a JSONL file of queries non-interactively")
+    parser.add_argument('--output', '-o', metavar='RESULTS.jsonl',
+                        help="where to write batch results (default: stdout)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="batch worker processes (default: CPU count)")
+    parser.add_argument('--serve', metavar='[HOST:]PORT',
+                        help="serve clients over TCP (newline-delimited JSON)")
+    parser.add_argument('--serve-unix', metavar='PATH',
+                        help="serve clients over a Unix socket")
+    parser.add_argument('--loadgen', metavar='HOST:PORT', nargs='?', const='',
+                        help="load-test a server (in-process server if no address)")
+    parser.add_argument('--connections', type=int, default=16,
+                        help="load generator clients (default: 16)")
+    parser.add_argument('--requests', type=int, default=500,
+                        help="requests per load generator client (default: 500)")
+    parser.add_argument('--depth', type=int, default=8,
+                        help="pipelined requests in flight per client (default: 8)")
+    parser.add_argument('--data-dir', metavar='DIR',
+                        help="load procedures from a directory of JSON files")
+    parser.add_argument('--watch', action='store_true',
+                        help="with --data-dir, apply edits to the directory while running")
+    parser.add_argument('--no-secondary', action='store_true',
+                        help="show only the best-matching procedure, never a second one")
+    parser.add_argument('--generator', metavar='BACKEND',
+                        help="generate answers from the retrieved procedure (backend: stand-in)")
+    parser.add_argument('--rebuild-cache', action='store_true',
+                        help="rebuild the cached indexes and compare warm and cold start times")
+    parser.add_argument('--generation-timeout', type=float, metavar='SECONDS',
+                        help="wait this long for generated text before showing the procedure (default: 2)")
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None):
     """Main function"""
+    args = parse_args(argv)
+    assistant_options = {'retrieval': args.retrieval, 'cache_size': args.cache_size,
+                         'metrics': not args.no_metrics, 'session_log': args.session_log,
+                         'data_dir': args.data_dir,
+                         'secondary_confidence': None if args.no_secondary else SECONDARY_CONFIDENCE,
+                         'generator': args.generator, 'generation_timeout': args.generation_timeout}
+    
+    if args.rebuild_cache:
+        rebuild_cache_mode(**assistant_options)
+        return
+    if args.batch:
+        batch_mode(args.batch, args.output, args.workers, **assistant_options)
+        return
+    # Batch jobs read one fixed version; everything else may follow edits
+    assistant_options['watch'] = args.watch
+    if args.serve or args.serve_unix:
+        server_mode(args.serve, args.serve_unix, **assistant_options)
+        return
+    if args.loadgen is not None:
+        loadgen_mode(args.loadgen or None, args.connections, args.requests, args.depth,
+                     **assistant_options)
+        return
+    if args.startup_report:
+        startup_report(args.query or "Someone is bleeding heavily from their arm",
+                       **assistant_options)
+        return
+    if args.query:
+        answer_query_mode(args.query, **assistant_options)
+        return
+    
     print("🚨 OFFLINE CRISIS ASSISTANT - DEMO VERSION")
     print("Simulating LLM-powered emergency guidance system")
     print("No internet connection required!")
@@ -236,15 +1115,15 @@ def main():
         choice = input("\nSelect mode (1, 2, or 3): ").strip()
         
         if choice == "1":
-            demo_mode()
+            demo_mode(**assistant_options)
         elif choice == "2":
-            interactive_mode()
+            interactive_mode(**assistant_options)
         elif choice == "3":
-            assistant = OfflineCrisisAssistant()
+            assistant = OfflineCrisisAssistant(**assistant_options)
             assistant.show_system_status()
         else:
             print("Invalid choice. Running demo mode by default...")
-            demo_mode()
+            demo_mode(**assistant_options)
             
     except KeyboardInterrupt:
         print("\n👋 Goodbye!")
@@ -252,4 +1131,4 @@ def main():
         print(f"❌ Error starting application: {e}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,181 @@
+# session_log.py
+# Bounded, buffered structured session/audit log for the Crisis Assistant
+
+import atexit
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict
+
+# When to fsync the log file after writing a batch
+FSYNC_POLICIES = ('always', 'interval', 'never')
+
+
+class SessionLogger:
+    """
+    Per-query audit log written to disk as compact JSONL
+    log() only appends to an in-memory ring buffer and never touches the
+    disk; a background thread serializes and writes records in batches.
+    If the buffer fills faster than the disk drains it, the oldest records
+    are dropped (and counted) rather than blocking a query.
+
+    Files rotate at max_bytes (session.jsonl -> session.jsonl.1 -> ...).
+    Each batch is written as whole lines, so after a crash at most the
+    last line of the active file can be incomplete.
+    """
+
+    def __init__(self, path: str, buffer_size: int = 4096, batch_size: int = 256,
+                 flush_interval: float = 1.0, max_bytes: int = 5 * 1024 * 1024,
+                 backups: int = 3, fsync: str = 'interval', fsync_interval: float = 5.0):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy: {fsync}")
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+
+        self.records_logged = 0
+        self.records_written = 0
+        self.records_dropped = 0
+        self.records_failed = 0
+        self.write_errors = 0
+
+        self._buffer: deque = deque(maxlen=buffer_size)
+        self._wake = threading.Event()
+        self._flushed = threading.Condition()
+        self._closed = False
+        self._last_fsync = time.monotonic()
+        # Written since the last fsync; synced on a later wake-up if idle
+        self._unsynced = False
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._file = open(path, 'ab')
+        self._size = self._file.tell()
+
+        self._thread = threading.Thread(target=self._run, name='session-log', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def log(self, record: Dict):
+        """Queue a record; never blocks on disk I/O
+
+        The record is serialized later on the writer thread, so callers
+        must not modify it after logging.
+        """
+        if len(self._buffer) == self._buffer.maxlen:
+            self.records_dropped += 1
+        self._buffer.append(record)
+        self.records_logged += 1
+        if len(self._buffer) >= self.batch_size:
+            self._wake.set()
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Wait until every queued record has been written; False on timeout"""
+        target = self.records_logged
+        deadline = time.monotonic() + timeout
+        with self._flushed:
+            while self._records_done() < target:
+                self._wake.set()
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._thread.is_alive():
+                    return False
+                self._flushed.wait(remaining)
+        return True
+
+    def _records_done(self) -> int:
+        """Records that have left the buffer: written, dropped or failed"""
+        return self.records_written + self.records_dropped + self.records_failed
+
+    def close(self):
+        """Write out queued records, fsync and stop the writer thread"""
+        if self._closed:
+            return
+        self._closed = True
+        self._wake.set()
+        self._thread.join(timeout=10.0)
+        if not self._file.closed:
+            self._sync()
+            self._file.close()
+
+    def stats(self) -> Dict:
+        return {
+            'path': self.path,
+            'logged': self.records_logged,
+            'written': self.records_written,
+            'dropped': self.records_dropped,
+            'failed': self.records_failed,
+            'buffered': len(self._buffer),
+            'write_errors': self.write_errors,
+        }
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            while self._buffer:
+                self._write_batch()
+                with self._flushed:
+                    self._flushed.notify_all()
+            # The last batch before a quiet spell is synced on the timer
+            # rather than waiting for the next batch or close()
+            if self._unsynced and self._sync_due():
+                try:
+                    self._sync()
+                except OSError:
+                    self.write_errors += 1
+            if self._closed:
+                break
+
+    def _write_batch(self):
+        lines = []
+        while self._buffer and len(lines) < self.batch_size:
+            record = self._buffer.popleft()
+            lines.append(json.dumps(record, ensure_ascii=False, separators=(',', ':')))
+        data = ('\n'.join(lines) + '\n').encode('utf-8')
+
+        try:
+            if self._size and self._size + len(data) > self.max_bytes:
+                self._rotate()
+            self._file.write(data)
+            self._file.flush()
+            self._size += len(data)
+            self.records_written += len(lines)
+            self._unsynced = True
+            if self.fsync == 'always' or self._sync_due():
+                self._sync()
+        except OSError:
+            # A full or failing disk must not take the assistant down
+            self.write_errors += 1
+            self.records_failed += len(lines)
+
+    def _sync_due(self) -> bool:
+        return (self.fsync == 'interval' and
+                time.monotonic() - self._last_fsync >= self.fsync_interval)
+
+    def _sync(self):
+        if self.fsync != 'never':
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        self._last_fsync = time.monotonic()
+        self._unsynced = False
+
+    def _rotate(self):
+        """Shift session.jsonl.N files up by one and start a fresh file"""
+        self._sync()
+        self._file.close()
+        for index in range(self.backups - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._file = open(self.path, 'ab')
+        self._size = 0
@@ -0,0 +1,112 @@
+# text_index.py
+# Full-text BM25 retrieval over procedure text for the Crisis Assistant
+
+import re
+from collections import Counter
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+# Procedure fields that are searched, in addition to the keyword lists
+TEXT_FIELDS = ('title', 'procedure', 'critical_warnings', 'supplies_needed', 'when_to_seek_help')
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+# Common words that carry no meaning for emergency classification
+STOP_WORDS = frozenset("""
+    a an and are as at be by for from has have he her his i if in is it its
+    me my of on or our she so than that the their them they this to was we
+    were what when where which who will with you your
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase text and split it into searchable terms"""
+    return [t for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOP_WORDS]
+
+
+def procedure_text(procedure: Dict, keywords: List[str] = ()) -> str:
+    """Join the searchable fields of a procedure into one document"""
+    parts = []
+    for field in TEXT_FIELDS:
+        value = procedure.get(field, '')
+        if isinstance(value, str):
+            parts.append(value)
+        else:
+            parts.extend(value)
+    parts.extend(keywords)
+    return '\n'.join(parts)
+
+
+class BM25Index:
+    """
+    BM25 index over the full text of every procedure
+    Term weights are precomputed into a sparse term-document matrix stored
+    row-wise (one row of postings per term), so scoring a query is one
+    vectorized accumulation over the postings of its terms
+    """
+
+    def __init__(self, procedures: Dict[str, Dict], keywords: Dict[str, List[str]] = None,
+                 k1: float = 1.5, b: float = 0.75):
+        keywords = keywords or {}
+        self.types = list(procedures)
+        self.k1 = k1
+        self.b = b
+
+        doc_terms = [Counter(tokenize(procedure_text(procedures[t], keywords.get(t, []))))
+                     for t in self.types]
+        self.vocabulary: Dict[str, int] = {}
+        rows, docs, freqs = [], [], []
+        for doc_id, terms in enumerate(doc_terms):
+            for term, freq in terms.items():
+                rows.append(self.vocabulary.setdefault(term, len(self.vocabulary)))
+                docs.append(doc_id)
+                freqs.append(freq)
+
+        rows = np.asarray(rows, dtype=np.int64)
+        docs = np.asarray(docs, dtype=np.int32)
+        freqs = np.asarray(freqs, dtype=np.float32)
+        doc_lengths = np.asarray([sum(terms.values()) for terms in doc_terms], dtype=np.float32)
+        avg_length = float(doc_lengths.mean()) if len(doc_lengths) and doc_lengths.mean() else 1.0
+
+        n_docs = len(self.types)
+        doc_freq = np.bincount(rows, minlength=len(self.vocabulary)).astype(np.float32)
+        self.idf = np.log1p((n_docs - doc_freq + 0.5) / (doc_freq + 0.5)).astype(np.float32)
+
+        norm = k1 * (1.0 - b + b * doc_lengths[docs] / avg_length)
+        weights = self.idf[rows] * freqs * (k1 + 1.0) / (freqs + norm)
+
+        # Sort postings by term to get compressed sparse rows
+        order = np.argsort(rows, kind='stable')
+        self.doc_ids = docs[order]
+        self.weights = weights[order].astype(np.float32)
+        self.indptr = np.zeros(len(self.vocabulary) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=len(self.vocabulary)), out=self.indptr[1:])
+
+    def _query_rows(self, query: str) -> List[int]:
+        """Term rows for the query terms found in the index"""
+        return [self.vocabulary[t] for t in tokenize(query) if t in self.vocabulary]
+
+    def score(self, query: str) -> np.ndarray:
+        """BM25 score of every procedure for the query"""
+        rows = self._query_rows(query)
+        if not rows:
+            return np.zeros(len(self.types), dtype=np.float32)
+        postings = np.concatenate([np.arange(self.indptr[r], self.indptr[r + 1]) for r in rows])
+        return np.bincount(self.doc_ids[postings], weights=self.weights[postings],
+                           minlength=len(self.types))
+
+    def max_score(self, query: str) -> float:
+        """Upper bound of the BM25 score any procedure can reach for the query"""
+        return float(sum(self.idf[r] for r in self._query_rows(query)) * (self.k1 + 1.0))
+
+    def search(self, query: str, top_k: int = 5) -> List[Tuple[str, float]]:
+        """Return up to top_k (emergency_type, score) pairs, best first"""
+        scores = self.score(query)
+        top_k = min(top_k, int(np.count_nonzero(scores)))
+        if top_k <= 0:
+            return []
+        # Partial selection of the best candidates, then order just those
+        candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+        candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+        return [(self.types[i], float(scores[i])) for i in candidates]
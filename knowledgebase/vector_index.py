@@ -0,0 +1,218 @@
+# vector_index.py
+# Offline dense-vector retrieval over procedures for the Crisis Assistant
+
+import json
+import os
+import sys
+import zlib
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+from index_cache import DEFAULT_CACHE_DIR
+from text_index import procedure_text, tokenize
+
+
+class HashingEmbedder:
+    """
+    Deterministic local text embedder - no model download needed
+    Words and their character trigrams are hashed into a fixed number of
+    signed buckets and the result is L2-normalized, so similar wording
+    (including small typos) gives similar vectors
+    """
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+
+    def _features(self, text: str) -> Counter:
+        features = Counter()
+        for token in tokenize(text):
+            features['w:' + token] += 2
+            padded = f"<{token}>"
+            for i in range(len(padded) - 2):
+                features['c:' + padded[i:i + 3]] += 1
+        return features
+
+    def embed(self, text: str) -> np.ndarray:
+        """Embed one text as a unit-length float32 vector"""
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature, count in self._features(text).items():
+            # crc32 is stable across runs, unlike the built-in hash()
+            bucket = zlib.crc32(feature.encode('utf-8'))
+            sign = -1.0 if bucket & 0x80000000 else 1.0
+            vector[bucket % self.dim] += sign * count
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector /= norm
+        return vector
+
+    def embed_batch(self, texts: Iterable[str]) -> np.ndarray:
+        """Embed several texts as rows of a float32 matrix"""
+        texts = list(texts)
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            matrix[row] = self.embed(text)
+        return matrix
+
+
+class VectorIndex:
+    """
+    Dense-vector index over every procedure
+    Vectors live in a memory-mapped float32 .npy file next to a small JSON
+    metadata file, so opening the index neither parses nor copies them.
+    Files are named by content hash, so knowledge bases sharing a cache
+    directory each keep their own index
+    """
+
+    # Indexes kept per cache directory; the least recently built go first
+    MAX_CACHED = 4
+
+    def __init__(self, vectors: np.ndarray, types: List[str], embedder: HashingEmbedder):
+        self.vectors = vectors
+        self.types = types
+        self.embedder = embedder
+
+    @staticmethod
+    def paths(cache_dir: str, content_hash: str) -> Tuple[str, str]:
+        """Locations of the vector file and its metadata"""
+        stem = os.path.join(cache_dir, f"vectors-{content_hash[:16]}")
+        return stem + '.npy', stem + '.json'
+
+    @staticmethod
+    def _embed_into(vectors: np.ndarray, procedures: Dict[str, Dict],
+                    keywords: Dict[str, List[str]], embedder: HashingEmbedder):
+        for row, emergency_type in enumerate(procedures):
+            vectors[row] = embedder.embed(procedure_text(procedures[emergency_type],
+                                                         keywords.get(emergency_type, [])))
+
+    @classmethod
+    def in_memory(cls, procedures: Dict[str, Dict], keywords: Dict[str, List[str]],
+                  dim: int = 512) -> 'VectorIndex':
+        """Embed every procedure into an ordinary array, writing nothing"""
+        embedder = HashingEmbedder(dim)
+        vectors = np.zeros((len(procedures), dim), dtype=np.float32)
+        cls._embed_into(vectors, procedures, keywords, embedder)
+        return cls(vectors, list(procedures), embedder)
+
+    @classmethod
+    def build(cls, procedures: Dict[str, Dict], keywords: Dict[str, List[str]],
+              cache_dir: str, content_hash: str, dim: int = 512) -> 'VectorIndex':
+        """Embed every procedure and write the memory-mapped index"""
+        embedder = HashingEmbedder(dim)
+        types = list(procedures)
+        vector_path, meta_path = cls.paths(cache_dir, content_hash)
+        os.makedirs(cache_dir, exist_ok=True)
+
+        # Write to temporary files first so a crash never leaves a torn index
+        tmp_vectors = vector_path + '.tmp.npy'
+        vectors = np.lib.format.open_memmap(tmp_vectors, mode='w+', dtype=np.float32,
+                                            shape=(len(types), dim))
+        cls._embed_into(vectors, procedures, keywords, embedder)
+        vectors.flush()
+        del vectors
+
+        with open(meta_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump({'content_hash': content_hash, 'dim': dim, 'types': types}, f)
+        os.replace(tmp_vectors, vector_path)
+        os.replace(meta_path + '.tmp', meta_path)
+        cls._prune(cache_dir)
+
+        return cls.open(cache_dir, content_hash)
+
+    @classmethod
+    def _prune(cls, cache_dir: str):
+        """Remove all but the MAX_CACHED most recently built indexes"""
+        try:
+            entries = [entry for entry in os.scandir(cache_dir)
+                       if entry.name.startswith('vectors-') and entry.name.endswith('.json')]
+            entries.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+            for entry in entries[cls.MAX_CACHED:]:
+                for path in (entry.path, entry.path[:-len('.json')] + '.npy'):
+                    os.remove(path)
+        except OSError:
+            pass  # another process pruned first; nothing is lost
+
+    @classmethod
+    def open(cls, cache_dir: str, content_hash: str) -> 'VectorIndex':
+        """Map an existing index; returns None if missing or out of date"""
+        vector_path, meta_path = cls.paths(cache_dir, content_hash)
+        try:
+            with open(meta_path, encoding='utf-8') as f:
+                meta = json.load(f)
+            vectors = np.load(vector_path, mmap_mode='r')
+        except (OSError, ValueError):
+            return None
+        if meta['content_hash'] != content_hash:
+            return None
+        if vectors.shape != (len(meta['types']), meta['dim']):
+            return None
+        return cls(vectors, meta['types'], HashingEmbedder(meta['dim']))
+
+    def search_batch(self, queries: List[str], top_k: int = 5) -> List[List[Tuple[str, float]]]:
+        """Return the top_k (emergency_type, similarity) pairs for each query"""
+        if not len(self.types) or not queries:
+            return [[] for _ in queries]
+        top_k = min(top_k, len(self.types))
+
+        # One matrix product scores every query against every procedure
+        similarities = self.embedder.embed_batch(queries) @ self.vectors.T
+        candidates = np.argpartition(-similarities, top_k - 1, axis=1)[:, :top_k]
+
+        results = []
+        for row, cols in enumerate(candidates):
+            cols = cols[np.argsort(-similarities[row, cols], kind='stable')]
+            results.append([(self.types[c], float(similarities[row, c]))
+                            for c in cols if similarities[row, c] > 0])
+        return results
+
+    def search(self, query: str, top_k: int = 5) -> List[Tuple[str, float]]:
+        """Return the top_k (emergency_type, similarity) pairs for a query"""
+        return self.search_batch([query], top_k)[0]
+
+
+def resident_memory_kb() -> int:
+    """Current resident set size in kB (Linux, including Raspberry Pi OS)"""
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+
+def memory_report(n_procedures: int, dim: int = 512, cache_dir: str = None):
+    """Compare resident memory of memory-mapped vectors with a dict of lists"""
+    cache_dir = cache_dir or os.path.join(DEFAULT_CACHE_DIR, 'memory_report')
+    os.makedirs(cache_dir, exist_ok=True)
+    vector_path = os.path.join(cache_dir, 'vectors.npy')
+    rng = np.random.default_rng(0)
+    vectors = np.lib.format.open_memmap(vector_path, mode='w+', dtype=np.float32,
+                                        shape=(n_procedures, dim))
+    for start in range(0, n_procedures, 1000):
+        vectors[start:start + 1000] = rng.random((min(1000, n_procedures - start), dim),
+                                                 dtype=np.float32)
+    vectors.flush()
+    del vectors
+
+    baseline = resident_memory_kb()
+    mapped = np.load(vector_path, mmap_mode='r')
+    after_open = resident_memory_kb()
+    mapped @ np.ones(dim, dtype=np.float32)
+    after_search = resident_memory_kb()
+    del mapped
+
+    as_dict = {f"procedure_{i}": row.tolist()
+               for i, row in enumerate(np.load(vector_path, mmap_mode='r'))}
+    after_dict = resident_memory_kb()
+
+    print(f"📊 VECTOR MEMORY REPORT - {n_procedures} procedures x {dim} dims")
+    print("="*60)
+    print(f"Memory-mapped, after open:    {after_open - baseline:>10} kB")
+    print(f"Memory-mapped, after search:  {after_search - baseline:>10} kB (page cache, shared)")
+    print(f"Python dict of float lists:   {after_dict - after_search:>10} kB")
+    print("="*60)
+    del as_dict
+
+
+if __name__ == "__main__":
+    memory_report(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)